@@ -21,7 +21,12 @@ param (
     [parameter(ParameterSetName="IncludeArtifacts")]
     [string] $OutDir,
     [switch] $NoCleanUp,
-    [string] $Timeout
+    [string] $Timeout,
+    [switch] $RebuildHarness,
+    [switch] $InProcess,
+    [switch] $Serve,
+    [string] $Socket,
+    [int] $PoolSize = [Environment]::ProcessorCount
 )
 
 # can't give both InFile and script content
@@ -30,8 +35,8 @@ if ($ScriptContent -and $InFile) {
     exit 1
 }
 
-# must give either script content or InFile
-if (!$ScriptContent -and !$InFile) {
+# must give either script content or InFile, unless serving requests
+if (!$Serve -and !$ScriptContent -and !$InFile) {
     [Console]::Error.WriteLine("[-] must give either script contents or input file")
     exit 1
 }
@@ -55,7 +60,7 @@ if ($EnvVar -and $EnvFile) {
 }
 
 # give OutDir a default value if the user hasn't specified they don't want artifacts 
-if (!$ReportOnly -and !$OutDir) {
+if (!$Serve -and !$ReportOnly -and !$OutDir) {
 
     if ($ScriptContent) {
         $OutDir = "./script.boxed"
@@ -289,15 +294,7 @@ function HandleCmdInvocation {
         "Id" = 0
     }
 
-    $hashed = "powershell.exe$invokedScript"
-
-    $stringStream = [System.IO.MemoryStream]::new()
-    $streamWriter = [System.IO.StreamWriter]::new($stringStream)
-    $streamWriter.write($hashed)
-    $streamWriter.Flush()
-    $stringStream.Position = 0
-
-    $action["BehaviorId"] = (Get-FileHash -InputStream $stringStream -Algorithm SHA256).Hash
+    $action["BehaviorId"] = BehaviorId $action["Actor"] $action["BehaviorProps"]
 
     $json = $action | ConvertTo-Json -Depth 10
     ($json + ",") | Out-File -Append "$WORK_DIR/actions.json"
@@ -330,10 +327,14 @@ function StripBugActions {
 function HandleDirectlyWrittenFiles {
 
     # Find directly written files heuristically by looking for files
-    # in the current directory whose name starts with 'C:' (not
-    # expected for Linux files).
+    # in the directory the script ran from, the one holding its working
+    # directory, whose name starts with 'C:' (not expected for Linux files).
+    $scriptDir = Split-Path -Parent $WORK_DIR
     $outDir = $WORK_DIR + "/untracked_artifacts/"
-    foreach ($payloadFile in (Get-ChildItem -path "." -name "C:*")) {
+    foreach ($payloadFile in (Get-ChildItem -path $scriptDir -name "C:*")) {
+
+        # not Join-Path, which would take the backslashes in the name for separators
+        $payloadPath = $scriptDir + "/" + $payloadFile
 
         # Does this look like a bogus "C:\foo\bar\baz" file we can
         # move as an artifact?
@@ -350,12 +351,12 @@ function HandleDirectlyWrittenFiles {
             $fname = $payloadFile.SubString($payloadFile.lastIndexOf("\") + 1)
 
             # Move the file to the artifact directory.
-            $fileObj::Move($payloadFile, ($outDir + $fname), $true)
+            $fileObj::Move($payloadPath, ($outDir + $fname), $true)
         }
 
         # Not an obvious bogus C: file. Just delete it.
         else {
-            Remove-Item $payloadFile
+            Remove-Item -LiteralPath $payloadPath
         }
     }
 }
@@ -381,6 +382,9 @@ function HarvestArtifacts {
     New-Item -Path $WORK_DIR/artifacts -ItemType "directory" > /dev/null 2>&1
     $outDir = $WORK_DIR + "/artifacts/"
 
+    $utf8 = [System.Text.UTF8Encoding]::new($false)
+    $writtenHashes = [System.Collections.Generic.HashSet[string]]::new()
+
     # Hacky handling for files directly written via obfuscated .NET
     # object calls (box-ps can't override these methods so they
     # actually run).
@@ -415,17 +419,24 @@ function HarvestArtifacts {
             # basic check to see if this may be interesting
             if ($artifactContent.Length -gt 10) {
 
-                # write content and compute sha256
-                $outPath = $outDir + "tmp.bin"
-
                 try {
                     # array content means bytes, assuming we'll never have an array of chars
                     if ($artifactIsArray) {
-                        [System.IO.File]::WriteAllBytes($outPath, $artifactContent)
+                        $artifactBytes = [byte[]]$artifactContent
+                    }
+                    # content is just text, stored as Out-File would write it
+                    elseif ($artifactContent -is [string]) {
+                        $artifactBytes = $utf8.GetBytes($artifactContent + [Environment]::NewLine)
                     }
-                    # content is just text
                     else {
-                        $artifactContent | Out-File $outPath
+                        $artifactBytes = $utf8.GetBytes(($artifactContent | Out-String))
+                    }
+
+                    # compute sha256, only write out content not seen yet
+                    $sha256 = [System.BitConverter]::ToString(
+                        [System.Security.Cryptography.SHA256]::HashData($artifactBytes)).Replace("-", "")
+                    if ($writtenHashes.Add($sha256)) {
+                        [System.IO.File]::WriteAllBytes($outDir + $sha256, $artifactBytes)
                     }
                 }
                 catch {
@@ -433,10 +444,6 @@ function HarvestArtifacts {
                     continue
                 }
 
-                # compute sha256 hash, move to artifact directory
-                $sha256 = $(Get-FileHash -Path $outPath -Algorithm SHA256).Hash
-                Move-Item -Path $outPath -Destination ($outDir + $sha256) -Force
-
                 # check if the bytes indicate a PE file
                 if ($artifactIsArray -and $artifactContent[0] -eq 77 -and $artifactContent[1] -eq 90) {
                     $fileType = "PE"
@@ -457,6 +464,552 @@ function HarvestArtifacts {
     return $artifactMap
 }
 
+# starts running a harnessed script in an opened runspace, recording its actions to the given
+# working directory
+function StartInRunspace {
+
+    param(
+        [string] $Script,
+        [System.Management.Automation.Runspaces.Runspace] $Runspace,
+        [string] $WorkDir = $WORK_DIR
+    )
+
+    # held here rather than by the harness so the actions still get written out if it never finishes
+    $recorder = NewActionRecorder $WorkDir
+    $Runspace.SessionStateProxy.SetVariable("BOXPS_RECORDER", $recorder)
+
+    $shell = [PowerShell]::Create()
+    $shell.Runspace = $Runspace
+    $shell.AddScript($Script) > $null
+
+    $inputs = [System.Management.Automation.PSDataCollection[PSObject]]::new()
+    $outputs = [System.Management.Automation.PSDataCollection[PSObject]]::new()
+    $inputs.Complete()
+
+    return @{
+        "Shell" = $shell;
+        "Runspace" = $Runspace;
+        "Recorder" = $recorder;
+        "Outputs" = $outputs;
+        "Invocation" = $shell.BeginInvoke($inputs, $outputs);
+        "Stopped" = $false
+    }
+}
+
+# tells a script started with StartInRunspace to stop, giving it a moment to wind down
+function StopInRunspace {
+
+    param(
+        [hashtable] $Run
+    )
+
+    $stopping = $Run.Shell.BeginStop($null, $null)
+    $Run.Stopped = $stopping.AsyncWaitHandle.WaitOne([TimeSpan]::FromSeconds(5))
+}
+
+# Waits on a script started with StartInRunspace, writing its output and errors to the files another
+# pwsh would have had them redirected to. They're appended after whatever its nested scripts already
+# wrote there. A script stuck in a .NET call can't be stopped, and its runspace is left running until
+# this process exits.
+function FinishInRunspace {
+
+    param(
+        [hashtable] $Run,
+        [bool] $TimedOut,
+        [string] $StdoutPath,
+        [string] $StderrPath
+    )
+
+    $stdout = @()
+    $stderr = @()
+
+    if (!$TimedOut) {
+
+        try {
+            $Run.Shell.EndInvoke($Run.Invocation) > $null
+        }
+        catch {
+
+            $exception = $_.Exception.GetBaseException()
+
+            # same marker pwsh uses so an invalid script is detected the same way
+            if ($exception -is [System.Management.Automation.ParseException]) {
+                $stderr += "ParserError: " + $exception.Message
+            }
+            elseif ($exception -isnot [System.Management.Automation.PipelineStoppedException]) {
+                $stderr += $exception.Message
+            }
+        }
+    }
+
+    # same streams pwsh would have written to stdout and stderr
+    $stdout += $Run.Outputs | Out-String -Stream
+    $stdout += $Run.Shell.Streams.Information | ForEach-Object { [string]$_.MessageData }
+    $stdout += $Run.Shell.Streams.Warning | ForEach-Object { "WARNING: " + $_.Message }
+    $stderr += $Run.Shell.Streams.Error | ForEach-Object { $_.ToString() }
+
+    $stdout | Out-File -Append $StdoutPath
+    $stderr | Out-File -Append $StderrPath
+
+    # a script that couldn't be stopped drops any actions it records from here on
+    FlushActionRecorder $Run.Recorder -Close
+
+    if (!$TimedOut -or $Run.Stopped) {
+        $Run.Shell.Dispose()
+        $Run.Runspace.Dispose()
+    }
+}
+
+# Runs the harnessed script in a new runspace of this process rather than in another pwsh. On timeout
+# the pipeline is stopped and 124 is returned like the timeout utility would, otherwise 0.
+function InvokeInRunspace {
+
+    param(
+        [string] $Script,
+        [string] $Timeout,
+        [string] $StdoutPath,
+        [string] $StderrPath
+    )
+
+    $runspace = [RunspaceFactory]::CreateRunspace()
+    $runspace.Open()
+    $runspace.SessionStateProxy.Path.SetLocation((Get-Location).ProviderPath) > $null
+
+    $run = StartInRunspace $Script $runspace
+
+    $timedOut = $false
+    if ($Timeout -and !$run.Invocation.AsyncWaitHandle.WaitOne([TimeSpan]::FromSeconds([double]$Timeout))) {
+        $timedOut = $true
+        StopInRunspace $run
+    }
+
+    FinishInRunspace $run $timedOut $StdoutPath $StderrPath
+
+    if ($timedOut) {
+        return 124
+    }
+
+    return 0
+}
+
+# detects critical errors in sandboxing from the exit code and stderr of the sandboxed script.
+# Returns the reason and the code box-ps should exit with, or null if it didn't fail
+function SandboxFailure {
+
+    param(
+        [int] $ExitCode,
+        [string] $Stderr
+    )
+
+    # indicates a script with invalid syntax
+    if ($Stderr -and $Stderr.Contains("ParserError: ")) {
+        return @{ "Reason" = "invalid script syntax"; "Code" = 6 }
+    }
+
+    # check for timeout
+    if ($ExitCode -eq 124) {
+        return @{ "Reason" = "sandboxing timed out"; "Code" = 124 }
+    }
+
+    return $null
+}
+
+# builds the JSON report from everything the sandboxed script left in its working directory
+function BuildReportJson {
+
+    param(
+        [string] $WorkDir,
+        [switch] $Compress
+    )
+
+    # functions called from here write to whatever working directory is in scope
+    $WORK_DIR = $WorkDir
+
+    # ingest the recorded actions
+    $actionsJson = Get-Content -Raw "$WORK_DIR/actions.json"
+    if ($null -eq $actionsJson) {
+        $actionsJson = ""
+    }
+
+    $actions = "[" + $actionsJson.TrimEnd(",`r`n") + "]" | ConvertFrom-Json
+    if ($null -eq $actions) {
+        $actions = @()
+    }
+    $actions = $(StripBugActions $actions)
+    
+    # go gather the IOCs we may have scraped
+    $scrapedNetwork = Get-Content $WORK_DIR/scraped_network.txt -ErrorAction SilentlyContinue
+    $scrapedPaths = Get-Content $WORK_DIR/scraped_paths.txt -ErrorAction SilentlyContinue
+    $scrapedEnvProbes = Get-Content $WORK_DIR/scraped_probes.txt -ErrorAction SilentlyContinue
+
+    # write out artifacts of the script from actions data
+    $artifactMap = HarvestArtifacts $actions
+
+    # record the PEs found from variables content
+    if (Test-Path $WORK_DIR/in_mem_pes.txt) {
+        $potentialArtifacts = [string[]](Get-Content $WORK_DIR/in_mem_pes.txt)
+    }
+    else {
+        $potentialArtifacts = @()
+    }
+
+    # create the report and convert to JSON
+    $report = [Report]::new($actions, $scrapedNetwork, $scrapedPaths, 
+        $scrapedEnvProbes, $artifactMap, $potentialArtifacts, $WORK_DIR)
+
+    return $report | ConvertTo-Json -Depth 10 -Compress:$Compress
+}
+
+# moves the output of the sandboxed script worth keeping from its working directory to the
+# analysis directory, along with the report
+function WriteOutDir {
+
+    param(
+        [string] $WorkDir,
+        [string] $OutDir,
+        [string] $ReportJson
+    )
+
+    # overwrite output dir if it already exists
+    if (Test-Path $OutDir) {
+        Remove-Item -Recurse $OutDir/*
+    }
+    else {
+        New-Item $OutDir -ItemType Directory > $null
+    }
+
+    # move some stuff from working directory here
+    Move-Item $WorkDir/stdout.txt $OutDir/
+    Move-Item $WorkDir/stderr.txt $OutDir/
+    Move-Item $WorkDir/layers.ps1 $OutDir/
+
+    if ($(Test-Path $WorkDir/artifacts) -and $(Get-ChildItem $WorkDir/artifacts).Length -gt 0) {
+        Move-Item $WorkDir/artifacts $OutDir
+    }
+    if ($(Test-Path $WorkDir/untracked_artifacts) -and $(Get-ChildItem $WorkDir/untracked_artifacts).Length -gt 0) {
+        Move-Item $WorkDir/untracked_artifacts $OutDir
+    }
+
+    $ReportJson | Out-File $OutDir/report.json
+}
+
+# a runspace for the serve pool, opened in the background with the box-ps modules already imported
+function NewPoolRunspace {
+
+    param(
+        [System.Management.Automation.Runspaces.InitialSessionState] $SessionState
+    )
+
+    $runspace = [RunspaceFactory]::CreateRunspace($SessionState)
+    $runspace.OpenAsync()
+
+    return $runspace
+}
+
+# Takes a fresh runspace from the serve pool, set to run from the given directory, and starts opening
+# another to take its place. Runspaces are never reused, so nothing a script defines can leak into the
+# next one.
+function TakePoolRunspace {
+
+    param(
+        [hashtable] $Server,
+        [string] $Location
+    )
+
+    $runspace = $Server.Pool.Dequeue()
+    $Server.Pool.Enqueue((NewPoolRunspace $Server.SessionState))
+
+    # may still be opening
+    while ($runspace.RunspaceStateInfo.State -eq "BeforeOpen" -or 
+           $runspace.RunspaceStateInfo.State -eq "Opening") {
+        Start-Sleep -Milliseconds 10
+    }
+
+    if ($runspace.RunspaceStateInfo.State -ne "Opened") {
+        throw "failed to open runspace: $($runspace.RunspaceStateInfo.Reason)"
+    }
+
+    $runspace.SessionStateProxy.Path.SetLocation($Location) > $null
+    return $runspace
+}
+
+# one line of JSON answering a request. The report is spliced in as is rather than being serialized
+# a second time
+function ServeResponse {
+
+    param(
+        [object] $Id,
+        [int] $ExitCode,
+        [string] $ErrorMessage,
+        [string] $ReportJson
+    )
+
+    $response = @{ "Id" = $Id; "ExitCode" = $ExitCode; "Error" = $ErrorMessage } | ConvertTo-Json -Compress
+    if (!$ReportJson) {
+        $ReportJson = "null"
+    }
+
+    return $response.Substring(0, $response.Length - 1) + ",`"Report`":" + $ReportJson + "}"
+}
+
+# Sets up a working directory for a request and starts sandboxing its script in a pool runspace. Each
+# request gets a run ID of its own standing in for the PID in the harness, so its working directory,
+# action counter, and artifacts are kept apart from the others. The script runs from a directory of
+# the request's own holding its working directory, so files it writes relative to where it runs are
+# too. Returns the state of the request, or one holding a Response if it couldn't be started.
+function StartServeRequest {
+
+    param(
+        [string] $Line,
+        [hashtable] $Server
+    )
+
+    $Server.RequestCount++
+    $runId = "$PID-$($Server.RequestCount)"
+
+    # functions called from here write to whatever working directory is in scope
+    $requestDir = "./request_$runId"
+    $WORK_DIR = "$requestDir/working_$runId"
+
+    $state = @{
+        "Id" = $null;
+        "RequestDir" = $requestDir;
+        "WorkDir" = $WORK_DIR
+    }
+
+    try {
+        $request = $Line | ConvertFrom-Json -AsHashtable
+    }
+    catch {
+        $state["Response"] = ServeResponse $null 1 "request is not valid JSON" $null
+        return $state
+    }
+
+    $state["Id"] = $request["Id"]
+    $state["OutDir"] = $request["OutDir"]
+
+    if (!$request["Script"]) {
+        $state["Response"] = ServeResponse $state.Id 1 "request has no Script" $null
+        return $state
+    }
+
+    try {
+
+        New-Item $WORK_DIR -ItemType Directory -Force > $null
+        New-Item $WORK_DIR/actions.json > $null
+
+        if ($request["EnvVars"]) {
+            $request["EnvVars"] | ConvertTo-Json | Out-File $WORK_DIR/input_env.json
+        }
+
+        $script = HandleCmdInvocation $request["Script"]
+        $harness = (CompleteHarness $Server.Template $WORK_DIR).Replace("<CODE_DIR>", $PSScriptRoot).Replace("<PID>", $runId)
+
+        # writes to the working directory relative to where the script runs from
+        Push-Location $requestDir
+        try {
+            $script = PreProcessScript $script $runId
+        }
+        finally {
+            Pop-Location
+        }
+
+        $runspace = TakePoolRunspace $Server (Resolve-Path $requestDir).ProviderPath
+        $state["Run"] = StartInRunspace ($harness + "`r`n`r`n" + $script) $runspace $WORK_DIR
+    }
+    catch {
+        $state["Response"] = ServeResponse $state.Id 4 "failed to start sandboxing: $($_.Exception.Message)" $null
+        Remove-Item -Recurse $requestDir -ErrorAction SilentlyContinue
+        return $state
+    }
+
+    if ($request["Timeout"]) {
+        $state["Deadline"] = [DateTime]::UtcNow.AddSeconds([double]$request["Timeout"])
+    }
+
+    return $state
+}
+
+# collects the results of a request started with StartServeRequest and cleans up after it
+function FinishServeRequest {
+
+    param(
+        [hashtable] $Request,
+        [bool] $TimedOut,
+        [hashtable] $Server
+    )
+
+    $WORK_DIR = $Request.WorkDir
+
+    try {
+
+        if ($TimedOut) {
+            StopInRunspace $Request.Run
+        }
+
+        FinishInRunspace $Request.Run $TimedOut "$WORK_DIR/stdout.txt" "$WORK_DIR/stderr.txt"
+
+        $exitCode = 0
+        if ($TimedOut) {
+            $exitCode = 124
+        }
+
+        $stderr = Get-Content -Raw "$WORK_DIR/stderr.txt"
+        $failure = SandboxFailure $exitCode $stderr
+
+        if ($failure) {
+            $response = ServeResponse $Request.Id $failure.Code "sandboxing failed: $($failure.Reason)...`n$stderr" $null
+        }
+        else {
+
+            $reportJson = BuildReportJson $WORK_DIR -Compress
+            if ($Request.OutDir) {
+                WriteOutDir $WORK_DIR $Request.OutDir $reportJson
+            }
+
+            $response = ServeResponse $Request.Id 0 "" $reportJson
+        }
+    }
+    catch {
+        $response = ServeResponse $Request.Id 4 "failed to post-process results: $($_.Exception.Message)" $null
+    }
+
+    if (!$Server.NoCleanUp) {
+        Remove-Item -Recurse $Request.RequestDir -ErrorAction SilentlyContinue
+    }
+
+    return $response
+}
+
+# Serves sandboxing requests read one JSON object per line until the reader runs out, answering each
+# with one line of JSON in the order they finish. Requests look like
+#   {"Id": <anything>, "Script": <script content>, "EnvVars": {<name>: <value>}, "Timeout": <seconds>,
+#    "OutDir": <analysis directory path>}
+# where only Script is required, and are answered with
+#   {"Id": <request Id>, "ExitCode": <box-ps exit code>, "Error": <message>, "Report": <report>}
+# Up to the pool size of requests are sandboxed at once. Environment variables are set process wide,
+# so concurrent requests giving different values for the same variable can see each other's. Files a
+# script writes through .NET calls box-ps doesn't override resolve against the process too, so they
+# land in the directory box-ps serves from and aren't taken as artifacts of any request.
+function ServeStream {
+
+    param(
+        [System.IO.TextReader] $Reader,
+        [System.IO.TextWriter] $Writer,
+        [hashtable] $Server
+    )
+
+    $running = [System.Collections.Generic.List[hashtable]]::new()
+    $readTask = $Reader.ReadLineAsync()
+
+    try {
+
+        while ($null -ne $readTask -or $running.Count -gt 0) {
+
+            # take in another request once there's room for it
+            if ($null -ne $readTask -and $readTask.IsCompleted -and $running.Count -lt $Server.PoolSize) {
+
+                $line = $readTask.Result
+                $readTask = $null
+
+                if ($null -ne $line) {
+
+                    if ($line.Trim()) {
+                        $request = StartServeRequest $line $Server
+                        if ($request.ContainsKey("Response")) {
+                            $Writer.WriteLine($request.Response)
+                            $Writer.Flush()
+                        }
+                        else {
+                            $running.Add($request)
+                        }
+                    }
+
+                    $readTask = $Reader.ReadLineAsync()
+                }
+            }
+
+            # answer the requests that are done or out of time
+            foreach ($request in @($running)) {
+
+                $timedOut = $request.ContainsKey("Deadline") -and [DateTime]::UtcNow -gt $request.Deadline
+                if ($request.Run.Invocation.IsCompleted -or $timedOut) {
+                    $running.Remove($request) > $null
+                    $Writer.WriteLine((FinishServeRequest $request $timedOut $Server))
+                    $Writer.Flush()
+                }
+            }
+
+            # wait for something to finish or a new request to come in
+            $handles = @($running | ForEach-Object { $_.Run.Invocation.AsyncWaitHandle })
+            if ($null -ne $readTask -and $running.Count -lt $Server.PoolSize) {
+                $handles += ([IAsyncResult]$readTask).AsyncWaitHandle
+            }
+            if ($handles) {
+                [System.Threading.WaitHandle]::WaitAny($handles, 100) > $null
+            }
+        }
+    }
+    finally {
+
+        # the other end went away. Don't leave anything running
+        foreach ($request in $running) {
+            StopInRunspace $request.Run
+            FinishInRunspace $request.Run $true "$($request.WorkDir)/stdout.txt" "$($request.WorkDir)/stderr.txt"
+            if (!$Server.NoCleanUp) {
+                Remove-Item -Recurse $request.RequestDir -ErrorAction SilentlyContinue
+            }
+        }
+    }
+}
+
+# Serves requests over a Unix socket until the process is killed. Connections are served one after
+# another, with the requests on each one sandboxed concurrently.
+function ServeSocket {
+
+    param(
+        [string] $SocketPath,
+        [hashtable] $Server
+    )
+
+    if (Test-Path $SocketPath) {
+        Remove-Item $SocketPath
+    }
+
+    $listener = [System.Net.Sockets.Socket]::new([System.Net.Sockets.AddressFamily]::Unix, 
+        [System.Net.Sockets.SocketType]::Stream, [System.Net.Sockets.ProtocolType]::Unspecified)
+
+    try {
+
+        $listener.Bind([System.Net.Sockets.UnixDomainSocketEndPoint]::new($SocketPath))
+        $listener.Listen(16)
+        [Console]::Error.WriteLine("[+] serving on $SocketPath")
+
+        while ($true) {
+
+            $connection = $listener.Accept()
+            $stream = [System.Net.Sockets.NetworkStream]::new($connection, $true)
+            $reader = [System.IO.StreamReader]::new($stream)
+            $writer = [System.IO.StreamWriter]::new($stream)
+
+            try {
+                ServeStream $reader $writer $Server
+            }
+            catch {
+                [Console]::Error.WriteLine("[-] lost connection: $($_.Exception.Message)")
+            }
+            finally {
+                $writer.Dispose()
+                $reader.Dispose()
+            }
+        }
+    }
+    finally {
+        $listener.Dispose()
+        Remove-Item $SocketPath -ErrorAction SilentlyContinue
+    }
+}
+
 # clean up working directory if desired, remove imported modules, and exit with a code
 function CleanExit {
     
@@ -484,8 +1037,60 @@ function CleanExit {
 # This allows multiple box-ps instances to analyze samples in the same directory.
 $WORK_DIR = "./working_" + $PID
 
+# load everything once and sandbox scripts on request
+if ($Serve) {
+
+    if ($Docker) {
+        [Console]::Error.WriteLine("[-] can't serve requests from a docker container")
+        exit 1
+    }
+
+    Import-Module -Name $PSScriptRoot/HarnessBuilder.psm1
+    Import-Module -Name $PSScriptRoot/ScriptInspector.psm1
+
+    # runspaces in the pool start out with the modules the harness imports
+    $sessionState = [System.Management.Automation.Runspaces.InitialSessionState]::CreateDefault()
+    $sessionState.ImportPSModule([string[]]@("$PSScriptRoot/ScriptInspector.psm1", 
+        "$PSScriptRoot/HarnessBuilder.psm1"))
+
+    # waiting on requests is limited to 64 handles, one is for reading the next request
+    $PoolSize = [Math]::Max(1, [Math]::Min($PoolSize, 63))
+
+    $server = @{
+        "Template" = (GetHarnessTemplate -Rebuild:$RebuildHarness);
+        "SessionState" = $sessionState;
+        "Pool" = [System.Collections.Generic.Queue[System.Management.Automation.Runspaces.Runspace]]::new();
+        "PoolSize" = $PoolSize;
+        "RequestCount" = 0;
+        "NoCleanUp" = [bool]$NoCleanUp
+    }
+
+    for ($i = 0; $i -lt $PoolSize; $i++) {
+        $server.Pool.Enqueue((NewPoolRunspace $sessionState))
+    }
+
+    if ($Socket) {
+        ServeSocket $Socket $server
+    }
+    # stdout carries the responses, so nothing else can be written to it from here on
+    else {
+
+        $reader = [System.IO.StreamReader]::new([Console]::OpenStandardInput())
+        $writer = [System.IO.StreamWriter]::new([Console]::OpenStandardOutput())
+
+        try {
+            ServeStream $reader $writer $server
+        }
+        finally {
+            $writer.Dispose()
+            $reader.Dispose()
+        }
+    }
+
+    CleanExit -NoCleanUp $false -WorkDir $WORK_DIR -ExitCode 0
+}
 # pull down the box-ps docker container and run it in there
-if ($Docker) {
+elseif ($Docker) {
 
     # test to see if docker is installed. EXIT IF NOT
     try {
@@ -589,7 +1194,6 @@ else {
 
     $stderrPath = "$WORK_DIR/stderr.txt"
     $stdoutPath = "$WORK_DIR/stdout.txt"
-    $actionsPath = "$WORK_DIR/actions.json"
     $harnessedScriptPath = "$WORK_DIR/harnessed_script.ps1"
 
     # create working directory to store
@@ -601,7 +1205,6 @@ else {
     }
 
     # init working directory files
-    "1" | Out-File $WORK_DIR/action_id.txt
     New-Item $WORK_DIR/actions.json > $null
 
     Import-Module -Name $PSScriptRoot/HarnessBuilder.psm1
@@ -659,90 +1262,57 @@ else {
 
     Write-Host -NoNewLine "[+] building script harness..."
 
-    # build harness and integrate script with it
-    $harness = (BuildHarness).Replace("<CODE_DIR>", $PSScriptRoot).Replace("<PID>", $PID)
+    # build harness and integrate script with it. Comes from the harness cache unless it's stale or
+    # the user wants it rebuilt
+    $harness = (BuildHarness -Rebuild:$RebuildHarness).Replace("<CODE_DIR>", $PSScriptRoot).Replace("<PID>", $PID)
     $ScriptContent = PreProcessScript $ScriptContent $PID
 
-    # attach the harness to the script
+    # attach the harness to the script. Only needs to be on disk to run it in another shell
     $harnessedScript = $harness + "`r`n`r`n" + $ScriptContent
-    $harnessedScript | Out-File -FilePath $harnessedScriptPath
+    if (!$InProcess -or $NoCleanUp) {
+        $harnessedScript | Out-File -FilePath $harnessedScriptPath
+    }
 
     Write-Host " done"
     Write-Host -NoNewLine "[+] sandboxing harnessed script..."
 
-    # run it in another shell
-    if ($Timeout) {
-        (timeout --foreground $Timeout pwsh -noni $harnessedScriptPath 2> $stderrPath 1> $stdoutPath)
+    # run it in a runspace of this process
+    if ($InProcess) {
+        $sandboxExitCode = InvokeInRunspace -Script $harnessedScript -Timeout $Timeout `
+            -StdoutPath $stdoutPath -StderrPath $stderrPath
+    }
+    # run it in another shell. Interrupted on timeout so it gets to write out its recorded actions,
+    # killed if that doesn't stop it
+    elseif ($Timeout) {
+        (timeout --foreground -s INT -k 5 $Timeout pwsh -noni $harnessedScriptPath 2> $stderrPath 1> $stdoutPath)
+        $sandboxExitCode = $LASTEXITCODE
+
+        # timeout exits with the status of the kill rather than its own when it has to resort to it
+        if ($sandboxExitCode -eq 137) {
+            $sandboxExitCode = 124
+        }
     }
     else {
         pwsh -noni $harnessedScriptPath 2> $stderrPath 1> $stdoutPath
+        $sandboxExitCode = $LASTEXITCODE
     }
 
     Write-Host " done"
 
     # check for some indicators of sandboxing failure
     $stderr = Get-Content -Raw $stderrPath
-    $fail = $false
-    $errorReason = ""
-    $errorCode = 4
-
-    # detect some critical errors from the stderr of the sandbox process
-
-    # check for timeout
-    if ($LASTEXITCODE -eq 124) {
-        $fail = $true
-        $errorReason = "sandboxing timed out"
-        $errorCode = 124
-    }
-
-    # indicates a script with invalid syntax
-    if ($null -ne $stderr -and $stderr.Contains("ParserError: ")) {
-        $fail = $true
-        $errorReason = "invalid script syntax"
-        $errorCode = 6
-    }
+    $failure = SandboxFailure $sandboxExitCode $stderr
 
     # print error and exit
-    if ($fail) {
-        [Console]::Error.WriteLine("[-] sandboxing failed: $errorReason...")
+    if ($failure) {
+        [Console]::Error.WriteLine("[-] sandboxing failed: $($failure.Reason)...")
         [Console]::Error.WriteLine($stderr)
-        CleanExit -NoCleanUp $NoCleanUp -WorkDir $WORK_DIR -ExitCode $errorCode
+        CleanExit -NoCleanUp $NoCleanUp -WorkDir $WORK_DIR -ExitCode $failure.Code
     }
 
     Write-Host -NoNewLine "[+] post-processing results..."
 
-    # ingest the recorded actions
-    $actionsJson = Get-Content -Raw $actionsPath
-    if ($null -eq $actionsJson) {
-        $actionsJson = ""
-    }
-
-    $actions = "[" + $actionsJson.TrimEnd(",`r`n") + "]" | ConvertFrom-Json
-    if ($null -eq $actions) {
-        $actions = @()
-    }
-    $actions = $(StripBugActions $actions)
-    
-    # go gather the IOCs we may have scraped
-    $scrapedNetwork = Get-Content $WORK_DIR/scraped_network.txt -ErrorAction SilentlyContinue
-    $scrapedPaths = Get-Content $WORK_DIR/scraped_paths.txt -ErrorAction SilentlyContinue
-    $scrapedEnvProbes = Get-Content $WORK_DIR/scraped_probes.txt -ErrorAction SilentlyContinue
-
-    # write out artifacts of the script from actions data
-    $artifactMap = HarvestArtifacts $actions
-
-    # record the PEs found from variables content
-    if (Test-Path $WORK_DIR/in_mem_pes.txt) {
-        $potentialArtifacts = [string[]](Get-Content $WORK_DIR/in_mem_pes.txt)
-    }
-    else {
-        $potentialArtifacts = @()
-    }
-
-    # create the report and convert to JSON
-    $report = [Report]::new($actions, $scrapedNetwork, $scrapedPaths, 
-        $scrapedEnvProbes, $artifactMap, $potentialArtifacts, $WORK_DIR)
-    $reportJson = $report | ConvertTo-Json -Depth 10
+    $reportJson = BuildReportJson $WORK_DIR
 
     Write-Host " done"
 
@@ -753,28 +1323,7 @@ else {
 
     # user wants more detailed artifacts as well as the report
     if ($OutDir) {
-
-        # overwrite output dir if it already exists
-        if (Test-Path $OutDir) {
-            Remove-Item -Recurse $OutDir/*
-        }
-        else {
-            New-Item $OutDir -ItemType Directory > $null
-        }
-
-        # move some stuff from working directory here
-        Move-Item $WORK_DIR/stdout.txt $OutDir/
-        Move-Item $WORK_DIR/stderr.txt $OutDir/
-        Move-Item $WORK_DIR/layers.ps1 $OutDir/
-
-        if ($(Test-Path $WORK_DIR/artifacts) -and $(Get-ChildItem $WORK_DIR/artifacts).Length -gt 0) {
-            Move-Item $WORK_DIR/artifacts $OutDir
-        }
-        if ($(Test-Path $WORK_DIR/untracked_artifacts) -and $(Get-ChildItem $WORK_DIR/untracked_artifacts).Length -gt 0) {
-            Move-Item $WORK_DIR/untracked_artifacts $OutDir
-        }
-
-        $reportJson | Out-File $OutDir/report.json
+        WriteOutDir $WORK_DIR $OutDir $reportJson
     }
 
     CleanExit -NoCleanUp $NoCleanUp -WorkDir $WORK_DIR -ExitCode 0
@@ -66,19 +66,7 @@ class Action <# lawsuit... I'll be here all week #> {
     }
 
     [string] GetBehaviorId() {
-
-        $hashed = $this.Actor
-        foreach ($behaviorProp in $this.BehaviorProps.Keys) {
-            $hashed += $this.BehaviorProps[$behaviorProp] | Out-String
-        }
-
-        $stringStream = [System.IO.MemoryStream]::new()
-        $streamWriter = [System.IO.StreamWriter]::new($stringStream)
-        $streamWriter.write($hashed)
-        $streamWriter.Flush()
-        $stringStream.Position = 0
-
-        return (Get-FileHash -InputStream $stringStream -Algorithm SHA256).Hash
+        return (BehaviorId $this.Actor $this.BehaviorProps)
     }
 
     # linear walk through all parameters rebuilding bound params and switches
@@ -130,12 +118,31 @@ function RecordAction {
         [Action] $Action
     )
     
-    # read and update the running action id on disk
-    $Action.Id = [int](Microsoft.PowerShell.Management\Get-Content -Raw "$WORK_DIR/action_id.txt")
-    ($Action.Id + 1) | Out-File "$WORK_DIR/action_id.txt"
+    $recorder = $global:BOXPS_RECORDER
+
+    [Threading.Monitor]::Enter($recorder)
+    try {
+
+        # the sandbox gave up on the script
+        if ($recorder.Closed) {
+            return
+        }
+
+        $Action.Id = $recorder.NextId
+        $recorder.NextId++
 
-    $json = $Action | ConvertTo-Json -Depth 5
-    ($json + ",") | Out-File -Append "$WORK_DIR/actions.json"
+        $json = $Action | ConvertTo-Json -Depth 5
+        $recorder.Writer.WriteLine($json + ",")
+
+        $recorder.Pending++
+        if ($recorder.Pending -ge $recorder.BatchSize) {
+            $recorder.Writer.Flush()
+            $recorder.Pending = 0
+        }
+    }
+    finally {
+        [Threading.Monitor]::Exit($recorder)
+    }
 }
 
 function RedirectObjectCreation {
@@ -174,4 +181,16 @@ function FlattenProcessObjects {
 }
 
 Microsoft.PowerShell.Core\Import-Module -Name $CODE_DIR/ScriptInspector.psm1
-Microsoft.PowerShell.Core\Import-Module -Name $CODE_DIR/HarnessBuilder.psm1
\ No newline at end of file
+Microsoft.PowerShell.Core\Import-Module -Name $CODE_DIR/HarnessBuilder.psm1
+
+# Runs sandboxed in a runspace of box-ps are given their recorder, which box-ps flushes when they end.
+# Otherwise this is its own pwsh process, which can be killed on timeout or crash without a chance to
+# flush, so every action is written out as soon as it's recorded
+if ($null -eq $global:BOXPS_RECORDER) {
+
+    $global:BOXPS_RECORDER = NewActionRecorder $WORK_DIR -BatchSize 1
+
+    Microsoft.PowerShell.Utility\Register-EngineEvent -SourceIdentifier PowerShell.Exiting -Action {
+        FlushActionRecorder $global:BOXPS_RECORDER -Close
+    } > $null
+}
@@ -1,5 +1,52 @@
-# avoid that terrible Test-Path bug
-if ($MyInvocation.InvocationName -ne "Test-Path") {
+# variables of the harness itself and built-in ones, never scanned
+$BOXPS_IGNORE_VARS = [System.Collections.Generic.HashSet[string]]::new(
+    [string[]](Microsoft.PowerShell.Management\Get-Content $CODE_DIR/iocs_ignore_vars.txt), 
+    [StringComparer]::OrdinalIgnoreCase)
+
+# actor and variable name -> PE last hashed under that name when the actor was called, its length and
+# a hash of its ends, so PEs are only hashed again once they've been reassigned or changed
+$BOXPS_SCANNED_VARS = [System.Collections.Generic.Dictionary[string, hashtable]]::new(
+    [StringComparer]::OrdinalIgnoreCase)
+
+# hashes of the PEs found so far
+$BOXPS_PE_HASHES = [System.Collections.Generic.HashSet[string]]::new()
+
+# cheap stand-in for the content of a PE, a hash of its first and last few KB. Buffers decoded or
+# XORed in place keep their reference and length but not these
+function GetPEFingerprint {
+
+    param(
+        $Value
+    )
+
+    $FINGERPRINT_SIZE = 4 * 1024
+
+    # arrays holding values that aren't bytes have no fingerprint, they're not PEs
+    try {
+        $ends = [byte[]]($Value[0..($FINGERPRINT_SIZE - 1)] + 
+            $Value[($Value.Length - $FINGERPRINT_SIZE)..($Value.Length - 1)])
+    }
+    catch {
+        return $null
+    }
+
+    return [System.BitConverter]::ToString(
+        [System.Security.Cryptography.SHA256]::HashData($ends)).Replace("-", "")
+}
+
+# Scans the variables of the script for in-memory IOCs, skipping PEs already hashed and unchanged
+# since. Called first thing in the overrides, so the variables of the override are one scope up and
+# the ones of the script calling it are two
+function FindInMemoryIOCs {
+
+    param(
+        [string] $InvocationName
+    )
+
+    # avoid that terrible Test-Path bug
+    if ($InvocationName -eq "Test-Path") {
+        return
+    }
 
     $networkIOCs = @()
     $fileSystemIOCs = @()
@@ -7,7 +54,7 @@ if ($MyInvocation.InvocationName -ne "Test-Path") {
 
     # get the variables present in the scope of the script
     try{
-        $parentVars = Microsoft.PowerShell.Utility\Get-Variable -Scope 1
+        $parentVars = Microsoft.PowerShell.Utility\Get-Variable -Scope 2
     }
     # if they're dot sourceing an override, there will be no parent scope
     catch
@@ -15,53 +62,84 @@ if ($MyInvocation.InvocationName -ne "Test-Path") {
         $parentVars = @()
     }
 
-    # get the variables present in this scope
-    $localVars = Microsoft.PowerShell.Utility\Get-Variable -Scope 0
+    # get the variables present in the scope of the override
+    $localVarNames = [System.Collections.Generic.HashSet[string]]::new([StringComparer]::OrdinalIgnoreCase)
+    Microsoft.PowerShell.Utility\Get-Variable -Scope 1 | Microsoft.PowerShell.Core\ForEach-Object { 
+        $localVarNames.Add($_.Name) > $null 
+    }
 
     # filter out built-in variables and variables we declare to leave only user declared vars
-    $localVarNames = Microsoft.PowerShell.Utility\New-Object System.Collections.ArrayList
-    $localVars | ForEach-Object { $localVarNames.Add($_.Name) > $null }
-    $declaredVars = $parentVars | Microsoft.PowerShell.Core\Where-object { 
-        $localVarNames -notcontains $_.Name
+    $declaredVars = $parentVars | Microsoft.PowerShell.Core\Where-Object { 
+        !$localVarNames.Contains($_.Name) -and !$BOXPS_IGNORE_VARS.Contains($_.Name)
     }
 
-    $excluded = Microsoft.PowerShell.Management\Get-Content $CODE_DIR/iocs_ignore_vars.txt
-    $declaredVars = $declaredVars | Where-Object { $excluded -notcontains $_.Name }
-
     foreach ($declaredVar in $declaredVars) {
 
         $__value = $declaredVar.Value
 
         # look for PEs
-        if ($null -eq $__value -or $__value.GetType() -eq [int[]] -or $__value.GetType() -eq [byte[]]) {
+        if ($null -eq $__value -or $__value.GetType() -eq [int[]] -or $__value.GetType() -eq [byte[]] -or 
+            $__value.GetType() -eq [object[]]) {
 
             $MIN_PE_SIZE = 20 * 1024
 
             # sanity check on the size of the array
             if ($__value.Length -ge $MIN_PE_SIZE) {
 
-                # see if the array probably contains a PE
+                # see if the array probably contains a PE. Checked every time, a buffer can be decoded
+                # into one in place
                 if ($__value -and $__value[0] -eq 77 -and $__value[1] -eq 90) {
 
-                    # write the PE to disk
-                    Microsoft.PowerShell.Management\New-Item -Path $WORK_DIR/artifacts -ItemType "directory" > /dev/null 2>&1
-                    $outDir = $WORK_DIR + "/artifacts/"
-                    $outPath = $outDir + "tmp.bin"
-                    [System.IO.File]::WriteAllBytes($outPath, $__value)
-                    $sha256 = $(Get-FileHash -Path $outPath -Algorithm SHA256).Hash
-                    $destPath = $outDir + $sha256
+                    $fingerprint = GetPEFingerprint $__value
+                    if ($null -eq $fingerprint) {
+                        continue
+                    }
+
+                    # already hashed this one for this actor and it hasn't changed since
+                    $scannedKey = $InvocationName + "|" + $declaredVar.Name
+                    $scanned = $null
+                    if ($BOXPS_SCANNED_VARS.TryGetValue($scannedKey, [ref] $scanned) -and 
+                        [Object]::ReferenceEquals($scanned.Value.Target, $__value) -and 
+                        $scanned.Length -eq $__value.Length -and 
+                        $scanned.Fingerprint -eq $fingerprint) {
+                        continue
+                    }
+
+                    # bytes the script built up into an object[] are converted once here rather than
+                    # walked element by element
+                    if ($__value.GetType() -eq [object[]]) {
+                        $bytes = ConvertToByteArray $__value
+                        if ($null -eq $bytes) {
+                            continue
+                        }
+                    }
+                    else {
+                        $bytes = [byte[]]$__value
+                    }
+
+                    # held weakly so arrays the script is done with can still be collected
+                    $BOXPS_SCANNED_VARS[$scannedKey] = @{
+                        "Value" = [WeakReference]::new($__value);
+                        "Length" = $__value.Length;
+                        "Fingerprint" = $fingerprint
+                    }
+
+                    # hash it in memory, it only needs to go to disk the first time it's seen
+                    $sha256 = [System.BitConverter]::ToString(
+                        [System.Security.Cryptography.SHA256]::HashData($bytes)).Replace("-", "")
+                    $destPath = $WORK_DIR + "/artifacts/" + $sha256
 
                     # see if we don't already have that file as an artifact
-                    if (!(Microsoft.PowerShell.Management\Test-Path $destPath)) {
+                    if ($BOXPS_PE_HASHES.Add($sha256) -and !(Microsoft.PowerShell.Management\Test-Path $destPath)) {
 
-                        Microsoft.PowerShell.Management\Move-Item -Path $outPath -Destination $destPath
+                        Microsoft.PowerShell.Management\New-Item -Path $WORK_DIR/artifacts -ItemType "directory" > /dev/null 2>&1
+                        # .NET resolves relative paths against the process, not where the script runs from
+                        $fullPath = $ExecutionContext.SessionState.Path.GetUnresolvedProviderPathFromPSPath($destPath)
+                        [System.IO.File]::WriteAllBytes($fullPath, $bytes)
 
                         # report it
                         $sha256 | Microsoft.PowerShell.Utility\Out-File -Append "$WORK_DIR/in_mem_pes.txt"
                     }
-                    else {
-                        Microsoft.PowerShell.Management\Remove-Item $outPath
-                    }
                 }
             }
 
@@ -10,8 +10,7 @@ function mkdir {
         [Switch] $Force
     )
 
-    $scrapeIOCsCode = Microsoft.PowerShell.Management\Get-Content -Raw $CODE_DIR/harness/find_in_mem_iocs.ps1
-    Microsoft.PowerShell.Utility\Invoke-Expression $scrapeIOCsCode
+    FindInMemoryIOCs $MyInvocation.InvocationName
 
     $behaviors = @("file_system")
     $subBehaviors = @("new_directory")
@@ -151,8 +150,7 @@ function Invoke-Expression {
 
             RecordAction $([Action]::new($behaviors, $subBehaviors, "Microsoft.PowerShell.Utility\Invoke-Expression", $behaviorProps, $MyInvocation, ""))
 
-            $scrapeIOCsCode = Microsoft.PowerShell.Management\Get-Content -Raw $CODE_DIR/harness/find_in_mem_iocs.ps1
-            Microsoft.PowerShell.Utility\Invoke-Expression $scrapeIOCsCode
+            FindInMemoryIOCs $MyInvocation.InvocationName
 
             $gotEnclosingScope = $true
             try{
@@ -281,8 +279,7 @@ function Start-Job {
         [string] $WorkingDirectory
     )
 
-    $scrapeIOCsCode = Microsoft.PowerShell.Management\Get-Content -Raw $CODE_DIR/harness/find_in_mem_iocs.ps1
-    Microsoft.PowerShell.Utility\Invoke-Expression $scrapeIOCsCode
+    FindInMemoryIOCs $MyInvocation.InvocationName
 
     # the script that is executed by the job here is the scriptblock which is an unnamed function,
     # so we need to give it a name and feed in the arguments properly to sandbox
@@ -400,8 +397,7 @@ function New-Object {
         [string] $COMObject
     )
     
-    $scrapeIOCsCode = Microsoft.PowerShell.Management\Get-Content -Raw $CODE_DIR/harness/find_in_mem_iocs.ps1
-    Microsoft.PowerShell.Utility\Invoke-Expression $scrapeIOCsCode
+    FindInMemoryIOCs $MyInvocation.InvocationName
 
     $behaviors = @("new_object")
     $subBehaviors = @()
@@ -546,8 +542,7 @@ function powershell.exe {
         [switch] $NonInteractive
     )
 
-    $scrapeIOCsCode = Microsoft.PowerShell.Management\Get-Content -Raw $CODE_DIR/harness/find_in_mem_iocs.ps1 
-    Microsoft.PowerShell.Utility\Invoke-Expression $scrapeIOCsCode
+    FindInMemoryIOCs $MyInvocation.InvocationName
     
     $behaviors = @("script_exec")
     $subBehaviors = @("start_process")
@@ -653,8 +648,7 @@ Don't support importing from a path
         [string[]] $UsingNamespace
     )
 
-    $scrapeIOCsCode = Microsoft.PowerShell.Management\Get-Content -Raw $CODE_DIR/harness/find_in_mem_iocs.ps1
-    Microsoft.PowerShell.Utility\Invoke-Expression $scrapeIOCsCode
+    FindInMemoryIOCs $MyInvocation.InvocationName
     
     $behaviorProps = @{}
     if ($PSBoundParameters.ContainsKey("TypeDefinition")) {
@@ -755,8 +749,7 @@ function New-ScheduledTaskAction {
         $AsJob
     )
 
-    $scrapeIOCsCode = Microsoft.PowerShell.Management\Get-Content -Raw $CODE_DIR/harness/find_in_mem_iocs.ps1
-    Microsoft.PowerShell.Utility\Invoke-Expression $scrapeIOCsCode
+    FindInMemoryIOCs $MyInvocation.InvocationName
 
     $behaviors = @("task")
     $subBehaviors = @("new_task")
@@ -784,8 +777,7 @@ function New-ScheduledTaskPrincipal {
         $AsJob
     )
 
-    $scrapeIOCsCode = Microsoft.PowerShell.Management\Get-Content -Raw $CODE_DIR/harness/find_in_mem_iocs.ps1
-    Microsoft.PowerShell.Utility\Invoke-Expression $scrapeIOCsCode
+    FindInMemoryIOCs $MyInvocation.InvocationName
 
     $behaviors = @("task")
     $subBehaviors = @("new_task")
@@ -821,8 +813,7 @@ function New-ScheduledTaskTrigger {
         $WeeksInterval
     )
 
-    $scrapeIOCsCode = Microsoft.PowerShell.Management\Get-Content -Raw $CODE_DIR/harness/find_in_mem_iocs.ps1
-    Microsoft.PowerShell.Utility\Invoke-Expression $scrapeIOCsCode
+    FindInMemoryIOCs $MyInvocation.InvocationName
 
     # Convert flags to bools for tracking results.
     $Trigger = "??"
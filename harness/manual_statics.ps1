@@ -17,34 +17,83 @@ static [string] GetScriptFromArguments([string] $arguments) {
     return $script
 }
 
-# returns a path to a new harnessed_script_X.ps1 file that hasn't been taken
-static [string] GetHarnessFile([string] $directory) {
-
-    $found = $false
-    $count = 0
-    while (!$found) {
-        if (Microsoft.PowerShell.Management\Test-Path ($directory + "/harnessed_script_" + [string]$count + ".ps1")) {
-            $count++
-        }
-        else {
-            $found = $true
-        }
-    }
-    return ($directory + "/harnessed_script_" + [string]$count + ".ps1")
-}
-
-# run another box-ps subprocess to sandbox a script
+# sandbox a script in a new runspace of this process. The harness is only built for the first nested
+# script, every one after that reuses it. It's given the environment variables of the parent script's
+# run, and actions go to the same working directory as the parent script's. The output and errors of
+# the child are appended to the sandbox's stdout and stderr. Stopping the parent script (on timeout)
+# stops the child too
 static [void] SandboxScript([string] $script) {
 
     $CODE_DIR = "<CODE_DIR>"
     $WORK_DIR = "./working_<PID>"
 
-    # get off my back I'm not proud of what's happening here.
-    $harness = (BuildHarness).Replace("<CODE_" + "DIR>", $CODE_DIR).Replace("<PI" + "D>", "<PID>")
-    $harnessedScriptPath = [BoxPSStatics]::GetHarnessFile($WORK_DIR)
-    $harnessedScript = $harness + "`r`n`r`n" + (PreProcessScript $script "<PID>")
-    $harnessedScript | Out-File -FilePath $harnessedScriptPath
-    pwsh -noni $harnessedScriptPath 2>> $WORK_DIR/stderr.txt 1>> $WORK_DIR/stdout.txt
+    if ($null -eq $global:BOXPS_NESTED_HARNESS) {
+        # get off my back I'm not proud of what's happening here.
+        $global:BOXPS_NESTED_HARNESS = (CompleteHarness (GetHarnessTemplate) $WORK_DIR).Replace("<CODE_" + "DIR>", $CODE_DIR).Replace("<PI" + "D>", "<PID>")
+    }
+
+    $harnessedScript = $global:BOXPS_NESTED_HARNESS + "`r`n`r`n" + (PreProcessScript $script "<PID>")
+
+    $runspace = [RunspaceFactory]::CreateRunspace()
+    $runspace.Open()
+    $runspace.SessionStateProxy.Path.SetLocation((Microsoft.PowerShell.Management\Get-Location).ProviderPath) > $null
+
+    # nested scripts of the child reuse the harness too, and its actions go in with the parent's
+    $runspace.SessionStateProxy.SetVariable("BOXPS_NESTED_HARNESS", $global:BOXPS_NESTED_HARNESS)
+    $runspace.SessionStateProxy.SetVariable("BOXPS_RECORDER", $global:BOXPS_RECORDER)
+
+    $shell = [PowerShell]::Create()
+    $shell.Runspace = $runspace
+    $shell.AddScript($harnessedScript) > $null
+
+    $inputs = [System.Management.Automation.PSDataCollection[PSObject]]::new()
+    $outputs = [System.Management.Automation.PSDataCollection[PSObject]]::new()
+    $inputs.Complete()
+
+    $stdout = @()
+    $stderr = @()
+    $stopped = $true
+
+    try {
+
+        $invocation = $shell.BeginInvoke($inputs, $outputs)
+
+        # waited on a bit at a time, a blocking wait would keep the parent from being stopped
+        while (!$invocation.AsyncWaitHandle.WaitOne(100)) { }
+
+        $shell.EndInvoke($invocation) > $null
+    }
+    # the child didn't parse or otherwise couldn't be run at all
+    catch {
+        if ($_.Exception.GetBaseException() -isnot [System.Management.Automation.PipelineStoppedException]) {
+            $stderr += $_.Exception.GetBaseException().Message
+        }
+    }
+    finally {
+
+        # the parent is being stopped, so take the child down with it
+        if ($shell.InvocationStateInfo.State -eq "Running") {
+            $stopped = $shell.BeginStop($null, $null).AsyncWaitHandle.WaitOne([TimeSpan]::FromSeconds(5))
+        }
+
+        # host output (Write-Host) goes to stdout like it would in its own process
+        $stdout += $outputs | Microsoft.PowerShell.Utility\Out-String -Stream
+        $stdout += $shell.Streams.Information | Microsoft.PowerShell.Core\ForEach-Object { [string]$_.MessageData }
+        $stderr += $shell.Streams.Error | Microsoft.PowerShell.Core\ForEach-Object { $_.ToString() }
+
+        if ($stdout) {
+            $stdout | Microsoft.PowerShell.Utility\Out-File -Append "$WORK_DIR/stdout.txt"
+        }
+        if ($stderr) {
+            $stderr | Microsoft.PowerShell.Utility\Out-File -Append "$WORK_DIR/stderr.txt"
+        }
+
+        # a child stuck in a .NET call can't be stopped, and is left running until the process exits
+        if ($stopped) {
+            $shell.Dispose()
+            $runspace.Dispose()
+        }
+    }
 }
 
 static [ScriptBlock] ScriptBlockCreate([string] $script) {
@@ -8,9 +8,13 @@ import json
 import shutil
 import argparse
 import sys
+import queue
+import asyncio
+import hashlib
 
 import pyboxps.errors as errors
 import pyboxps.boxps_report as boxps_report
+import pyboxps.boxps_scheduler as boxps_scheduler
 
 ####################################################################################################
 def safe_str_convert(s):
@@ -58,17 +62,51 @@ def safe_str_convert(s):
             r = ''.join(filter(lambda x:x in string.printable, s))
     return r
 
+####################################################################################################
+def _unset_vmem_limit_in_child():
+    """
+    Lifts any soft limit on virtual memory. Runs in sandboxing child processes between fork and exec.
+    """
+
+    resource.setrlimit(resource.RLIMIT_AS, (-1, -1))
+
+####################################################################################################
+class _SandboxRun:
+    """
+    Everything needed to execute a single box-ps run and interpret its results.
+    """
+
+    ################################################################################################
+    def __init__(self, out_dir, report_only, report_file, timeout):
+
+        self.out_dir = out_dir
+        self.report_only = report_only
+        self.report_file = report_file
+        self.timeout = timeout
+        self.report_path = None
+
+        # parameters to box-ps.ps1 by name in the order they're given. True values are switches
+        self.boxps_params = {}
+
+        # full command line of the sandboxing process and any content to pipe into it
+        self.cmd = None
+        self.stdin = None
+
 ####################################################################################################
 class BoxPS:
 
     ################################################################################################
-    def __init__(self, boxps_path=None, docker=False):
+    def __init__(self, boxps_path=None, docker=False, scheduler=None, cache=None):
         """
         Creates a BoxPS sandboxing object. Validates the environment is set up correctly, so this
         will raise some kind of BoxPSEnvError if something's not right.
 
         @param boxps_path (str) optional path to box-ps installation
         @param docker (bool) whether or not to use docker to sandbox
+        @param scheduler (MemoryScheduler) optional scheduler every sandboxing run must be admitted
+        by before it starts. May be shared between BoxPS objects
+        @param cache (ReportCache) optional cache of results to return instead of sandboxing the
+        same script again. May be shared between BoxPS objects
         """
 
         # validate environment first
@@ -76,6 +114,8 @@ class BoxPS:
         
         self._install_dir = os.getenv("BOXPS")
         self._docker = docker
+        self._scheduler = scheduler
+        self._cache = cache
         
         # TODO write a class for ingesting the config in python and within box-ps
         with open(self._boxps_path + os.sep + "config.json", "r") as f:
@@ -152,41 +192,14 @@ class BoxPS:
         # we want to run pwsh. validate we can
         else:
 
-            limit = self._unset_soft_vmem_limit()
-
             try:
                 subprocess.check_call(["pwsh", "-v"], stdout=subprocess.PIPE, 
-                                      stderr=subprocess.PIPE)
+                                      stderr=subprocess.PIPE, preexec_fn=_unset_vmem_limit_in_child)
             except OSError as e:
                 raise errors.BoxPSDependencyError("pwsh: " + str(e))
 
-            self._reset_soft_vmem_limit(limit)
-
         return boxps_path
 
-    ################################################################################################
-    def _unset_soft_vmem_limit(self):
-        """
-        Queries for any soft limits on memory for the process. If there are some set, unsets them.
-
-        @return (int) limit on soft memory, or None if there isn't one
-        """
-
-        mem_limit = resource.getrlimit(resource.RLIMIT_AS)[0]
-        if mem_limit != -1:
-            resource.setrlimit(resource.RLIMIT_AS, (-1, -1))
-            return mem_limit
-        return None
-
-    ################################################################################################
-    def _reset_soft_vmem_limit(self, mem_limit):
-        """
-        Resets the soft limit on the processes memory if there was one.
-        """
-
-        if mem_limit is not None:
-            resource.setrlimit(resource.RLIMIT_AS, (mem_limit, -1))
-
     ################################################################################################
     def sandbox(self,
                 script=None,
@@ -197,8 +210,8 @@ class BoxPS:
                 report_only=False,
                 report_file=None):
         """
-        Sandbox powershell to produce a BoxPSReport and other script artifacts if desired. Unlimits
-        any soft memory limits on processes during the sanboxing, then resets them.
+        Sandbox powershell to produce a BoxPSReport and other script artifacts if desired. Lifts
+        any soft memory limits on the sandboxing process, leaving this process's limits alone.
         
         INPUT...
         Must take either raw script content or a path to an input script, but not both. Environment
@@ -228,6 +241,11 @@ class BoxPS:
         full analysis directory, in a temp folder named <random>-boxps.json, or at the path given in
         report_file.
 
+        CACHE...
+        If the BoxPS object was given a ReportCache, a script that's already been sandboxed with the
+        same environment variables and box-ps installation isn't run again. Its cached report and
+        analysis directory are copied to where they would have been written.
+
         ValueErrors will be raised if arguments are given in an incompatible combination.
 
         @param script (str) raw script content
@@ -243,6 +261,192 @@ class BoxPS:
         report and the second is the path to the full analysis directory
         """
 
+        self._validate_sandbox_args(script, in_file, out_dir, env_vars, report_only)
+
+        cache_key = None
+        if self._cache is not None:
+            cache_key = self._cache_key(script, in_file, env_vars)
+            cached = self._fetch_cached(cache_key, out_dir, report_only, report_file)
+            if cached is not None:
+                return cached
+
+        run = self._prepare_run(script, in_file, out_dir, env_vars, timeout, report_only,
+                                report_file)
+        returncode, stderr = self._execute_run(run)
+
+        return self._finish_run(run, returncode, stderr, cache_key)
+
+    ################################################################################################
+    async def sandbox_async(self,
+                            script=None,
+                            in_file=None,
+                            out_dir=None,
+                            env_vars=None,
+                            timeout=None,
+                            report_only=False,
+                            report_file=None):
+        """
+        Asyncio version of sandbox. Takes the same arguments, produces the same output files,
+        returns the same values, and raises the same errors, but waits on the sandboxing process
+        without blocking the event loop, so one thread can drive many sandboxes at once. If the
+        coroutine is cancelled, the sandboxing process is killed.
+
+        @return (BoxPSReport) report_only is given, otherwise a tuple where the first element is the
+        report and the second is the path to the full analysis directory
+        """
+
+        self._validate_sandbox_args(script, in_file, out_dir, env_vars, report_only)
+
+        cache_key = None
+        if self._cache is not None:
+            cache_key = self._cache_key(script, in_file, env_vars)
+            cached = self._fetch_cached(cache_key, out_dir, report_only, report_file)
+            if cached is not None:
+                return cached
+
+        run = self._prepare_run(script, in_file, out_dir, env_vars, timeout, report_only,
+                                report_file)
+        returncode, stderr = await self._execute_run_async(run)
+
+        return self._finish_run(run, returncode, stderr, cache_key)
+
+    ################################################################################################
+    async def sandbox_stream(self, scripts, concurrency=4, return_exceptions=False, **kwargs):
+        """
+        Sandbox many scripts concurrently, yielding the results in the order they finish. No more
+        than concurrency sandboxes run at a time, and scripts are pulled from the given iterable
+        only as slots free up. Any remaining sandboxes are cancelled if the caller stops iterating.
+
+            async for report in boxps.sandbox_stream(scripts, concurrency=16, report_only=True):
+                ...
+
+        @param scripts (iterable) of raw script content strings, or of dicts of keyword arguments
+        to sandbox_async for scripts that need their own arguments (e.g. {"in_file": path})
+        @param concurrency (int) max number of sandboxes to run at once
+        @param return_exceptions (bool) yield the BoxPSError raised for a script in place of its
+        result rather than raising it and ending the stream
+        @param kwargs arguments to sandbox_async shared by every script
+
+        @return (async generator) of results as sandbox_async would return them
+        """
+
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        scripts = iter(scripts)
+        pending = set()
+
+        # start sandboxing the next script if there is one
+        def start_next():
+
+            for item in scripts:
+                sandbox_args = dict(kwargs)
+                sandbox_args.update(item if isinstance(item, dict) else {"script": item})
+                pending.add(asyncio.ensure_future(self.sandbox_async(**sandbox_args)))
+                return True
+
+            return False
+
+        try:
+
+            while len(pending) < concurrency and start_next():
+                pass
+
+            while pending:
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                # refill the free slots before handing results back to the caller
+                while len(pending) < concurrency and start_next():
+                    pass
+
+                for task in done:
+
+                    try:
+                        result = task.result()
+                    except errors.BoxPSError as e:
+                        if not return_exceptions:
+                            raise
+                        result = e
+
+                    yield result
+
+        finally:
+
+            for task in pending:
+                task.cancel()
+
+            if pending:
+                await asyncio.wait(pending)
+
+    ################################################################################################
+    def _cache_key(self, script, in_file, env_vars):
+        """
+        Computes the key of a script's results in the report cache.
+
+        @return (str) cache key
+        """
+
+        if script is not None:
+            content = script.encode() if isinstance(script, str) else script
+        else:
+            try:
+                with open(in_file, "rb") as f:
+                    content = f.read()
+            except OSError:
+                # box-ps reports the bad input file, so let the run go ahead uncached
+                return None
+
+        return self._cache.key(self._boxps_path, content, env_vars, self._docker)
+
+    ################################################################################################
+    def _fetch_cached(self, cache_key, out_dir, report_only, report_file):
+        """
+        Looks for the results of a script in the report cache and puts them where sandbox would
+        have. See sandbox for a description of the arguments.
+
+        @param cache_key (str) key of the script's results
+
+        @return (BoxPSReport) or tuple of the analysis directory and the report as sandbox would
+        return them, or None if they aren't cached
+        """
+
+        if cache_key is None:
+            return None
+
+        if report_only:
+
+            report_path = report_file or tempfile.mkstemp(suffix="-boxps.json")[1]
+
+            if not self._cache.fetch(cache_key, report_path=report_path):
+                if not report_file:
+                    os.remove(report_path)
+                return None
+
+            return boxps_report.BoxPSReport(self._config, report_path=report_path)
+
+        made_out_dir = out_dir is None
+        if made_out_dir:
+            out_dir = tempfile.mkdtemp(suffix="-boxps")
+
+        if not self._cache.fetch(cache_key, out_dir=out_dir):
+            if made_out_dir:
+                shutil.rmtree(out_dir, ignore_errors=True)
+            return None
+
+        report_path = out_dir + os.sep + "report.json"
+        if report_file:
+            shutil.copyfile(report_path, report_file)
+
+        return out_dir, boxps_report.BoxPSReport(self._config, report_path=report_path)
+
+    ################################################################################################
+    def _validate_sandbox_args(self, script, in_file, out_dir, env_vars, report_only):
+        """
+        Raises a ValueError if the sandbox arguments are given in an incompatible combination. See
+        sandbox for a description of the arguments.
+        """
+
         # must give either a script or an input file
         if script is None and in_file is None:
             raise ValueError("must give sandbox either the script contents or an input file path")
@@ -260,18 +464,30 @@ class BoxPS:
             raise ValueError("giving environment variables into a docker container isn't " +
                 "supported yet")
 
+    ################################################################################################
+    def _prepare_run(self, script, in_file, out_dir, env_vars, timeout, report_only, report_file):
+        """
+        Lays out everything a single box-ps run needs (temp script and environment files, output
+        paths, and the command line) without executing anything. See sandbox for a description of
+        the arguments.
+
+        @return (_SandboxRun) description of the run
+        """
+
         # create a temp output directory if not given one and we want one
         if out_dir is None and not report_only:
             out_dir = tempfile.mkdtemp(suffix="-boxps")
 
+        run = _SandboxRun(out_dir, report_only, report_file, timeout)
+
         # decide where the output JSON report will live
         # or just one of them in the case of both out_dir and report_file
         if not report_only:
-            report_path = out_dir + os.sep + "report.json"
+            run.report_path = out_dir + os.sep + "report.json"
         elif report_file:
-            report_path = report_file
+            run.report_path = report_file
         else:
-            report_path = tempfile.mkstemp(suffix="-boxps.json")[1]
+            run.report_path = tempfile.mkstemp(suffix="-boxps.json")[1]
 
         if not self._docker:
 
@@ -281,16 +497,15 @@ class BoxPS:
                 with open(in_file, "w") as f:
                     f.write(script)
 
-            cmd = ["pwsh", "-noni", self._install_dir + os.sep + "box-ps.ps1", "-InFile", 
-                in_file]
+            run.boxps_params["InFile"] = in_file
 
             if report_only:
-                cmd += ["-ReportOnly", report_path]
+                run.boxps_params["ReportOnly"] = True
+                run.boxps_params["OutFile"] = run.report_path
             else:
-                cmd += ["-OutDir", out_dir]
+                run.boxps_params["OutDir"] = out_dir
 
             # write the env variables dict to a temp json file
-            env_file = None
             if env_vars is not None:
 
                 try:
@@ -303,47 +518,134 @@ class BoxPS:
                     raise errors.BoxPSError("failed to write temp file for environment variables: " + 
                         str(e))
 
-                cmd += ["-EnvFile", env_file]
+                run.boxps_params["EnvFile"] = env_file
 
             if timeout is not None:
-                cmd += ["-Timeout", str(timeout)]
-
-            limit = self._unset_soft_vmem_limit()
+                run.boxps_params["Timeout"] = str(timeout)
 
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = proc.communicate()
-            
-            self._reset_soft_vmem_limit(limit)
+            run.cmd = ["pwsh", "-noni", self._install_dir + os.sep + "box-ps.ps1"]
+            for name, value in run.boxps_params.items():
+                run.cmd += ["-" + name] if value is True else ["-" + name, value]
 
         # sandbox within docker container. Use docker-box-ps.sh so we can pipe directly into it
         else:
 
-            cmd = [self._install_dir + os.sep + "docker-box-ps.sh"]
-            cmd += ["-p"] if script else [in_file]
+            run.cmd = [self._install_dir + os.sep + "docker-box-ps.sh"]
+            run.cmd += ["-p"] if script else [in_file]
 
             # no artifacts written to disk outside the JSON report and in the docker container
             if report_only:
-                cmd += [report_path]
+                run.cmd += [run.report_path]
 
             # user wants an output directory with artifacts
             else:
-                cmd += ["-d", out_dir]
+                run.cmd += ["-d", out_dir]
 
             if timeout:
-                cmd += ["-t", str(timeout)]
+                run.cmd += ["-t", str(timeout)]
 
             # in-memory script content. no input script file is written outside the docker container
             if script:
-                proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, 
-                                        stderr=subprocess.PIPE)
-                stdout, stderr = proc.communicate(input=script)
+                run.stdin = script
+
+        return run
+
+    ################################################################################################
+    def _execute_run(self, run):
+        """
+        Runs the box-ps (or docker-box-ps.sh) process for a prepared run and waits for it. Lifts
+        any soft memory limits in the started process only. Waits to be admitted by the scheduler
+        first if there is one.
+
+        @param run (_SandboxRun) prepared run
+
+        @return (tuple) the return code and stderr of the sandboxing process
+        """
+
+        admission = self._scheduler.acquire() if self._scheduler else None
+
+        try:
+
+            # soft memory limits are lifted in the child only. Unsetting and resetting them on this
+            # process would race with other threads starting sandboxes
+            if run.stdin is not None:
+                proc = subprocess.Popen(run.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, 
+                                        stderr=subprocess.PIPE, preexec_fn=_unset_vmem_limit_in_child)
             else:
-                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = proc.communicate()
+                proc = subprocess.Popen(run.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        preexec_fn=_unset_vmem_limit_in_child)
+
+            if admission:
+                admission.watch(proc.pid)
+
+            stdout, stderr = proc.communicate(input=run.stdin)
+
+        finally:
+
+            if admission:
+                self._scheduler.release(admission)
+
+        return proc.returncode, stderr
+
+    ################################################################################################
+    async def _execute_run_async(self, run):
+        """
+        Asyncio version of _execute_run.
+
+        @param run (_SandboxRun) prepared run
+
+        @return (tuple) the return code and stderr of the sandboxing process
+        """
+
+        stdin = None
+        if run.stdin is not None:
+            stdin = run.stdin.encode() if isinstance(run.stdin, str) else run.stdin
+
+        admission = (await self._scheduler.acquire_async()) if self._scheduler else None
+
+        try:
+
+            # soft memory limits are lifted in the child only. Unsetting and resetting them on this
+            # process would race with the other sandboxes being started on the event loop
+            proc = await asyncio.create_subprocess_exec(*run.cmd,
+                stdin=subprocess.PIPE if stdin is not None else None, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, preexec_fn=_unset_vmem_limit_in_child)
+
+            if admission:
+                admission.watch(proc.pid)
+
+            try:
+                stdout, stderr = await proc.communicate(input=stdin)
+            except asyncio.CancelledError:
+                proc.kill()
+                await proc.wait()
+                raise
+
+        finally:
+
+            if admission:
+                self._scheduler.release(admission)
+
+        return proc.returncode, stderr
+
+    ################################################################################################
+    def _finish_run(self, run, returncode, stderr, cache_key=None):
+        """
+        Checks the result of a finished run for sandboxing failures and deserializes the report.
+        Successful results are added to the report cache if given a key for them.
+
+        @param run (_SandboxRun) the run that was executed
+        @param returncode (int) return code of the sandboxing process
+        @param stderr (str) stderr of the sandboxing process
+        @param cache_key (str) key to store the results under in the report cache
+
+        @return (BoxPSReport) report_only is given, otherwise a tuple where the first element is the
+        report and the second is the path to the full analysis directory
+        """
 
         # raise timeout error
-        if timeout is not None and proc.returncode == 124:
-            raise errors.BoxPSTimeoutError("failed to sandbox within " + str(timeout) + 
+        if run.timeout is not None and returncode == 124:
+            raise errors.BoxPSTimeoutError("failed to sandbox within " + str(run.timeout) + 
                 " second(s)")
 
         # not stderr on the sandboxing sub-process. this means a critical error running the sandbox
@@ -351,36 +653,461 @@ class BoxPS:
             error = safe_str_convert(stderr).replace("[-] ", "")
 
             # raise invalid syntax error
-            if proc.returncode == 6:
+            if returncode == 6:
                 raise errors.BoxPSScriptSyntaxError(error)
 
             raise errors.BoxPSSandboxError(error)
 
         # no report is also a critical error
-        if not os.path.exists(report_path):
+        if not os.path.exists(run.report_path):
 
             msg = "no JSON report produced"
 
             # add sandbox stderr to error message if we got it
-            sandbox_stderr = out_dir + os.sep + "stderr.txt"
-            if os.path.exists(sandbox_stderr):
-                with open(sandbox_stderr, "r") as f:
-                    msg += "...\n" + f.read()
+            if run.out_dir is not None:
+                sandbox_stderr = run.out_dir + os.sep + "stderr.txt"
+                if os.path.exists(sandbox_stderr):
+                    with open(sandbox_stderr, "r") as f:
+                        msg += "...\n" + f.read()
 
             raise errors.BoxPSSandboxError(msg)
 
         # logic is just cleaner this way since docker-box-ps.sh doesn't support putting report and 
         # analysis dir in two different spots
-        if not report_only and report_file:
-            shutil.copyfile(report_path, report_file)
+        if not run.report_only and run.report_file:
+            shutil.copyfile(run.report_path, run.report_file)
 
         # deserialize the JSON report into a BoxPSReport
-        report = boxps_report.BoxPSReport(self._config, report_path=report_path)
+        report = boxps_report.BoxPSReport(self._config, report_path=run.report_path)
+
+        # a result that can't be cached (full disk, permissions) is still a result. it just gets
+        # sandboxed again next time
+        if cache_key is not None:
+            try:
+                self._cache.store(cache_key, run.report_path, None if run.report_only else run.out_dir)
+            except OSError:
+                pass
     
-        return report if report_only else (out_dir, report)
+        return report if run.report_only else (run.out_dir, report)
+
+####################################################################################################
+# PowerShell loop run by each BoxPSPool worker. Reads one JSON request per line from stdin, runs
+# box-ps.ps1 with the requested parameters in the already warm session, and answers with a single
+# line on stdout holding the exit code and whatever box-ps wrote to stderr.
+_POOL_WORKER_LOOP = """
+while ($null -ne ($line = [Console]::In.ReadLine())) {
+
+    $request = $line | ConvertFrom-Json -AsHashtable
+    $params = $request["Params"]
+    $stderr = [System.IO.StringWriter]::new()
+    $origStderr = [Console]::Error
+
+    [Console]::SetError($stderr)
+    Push-Location $request["Cwd"]
+    $global:LASTEXITCODE = 0
+
+    try {
+        $output = & $request["BoxPS"] @params 2>&1 6>$null
+        $exitCode = $LASTEXITCODE
+        foreach ($record in $output) {
+            if ($record -is [System.Management.Automation.ErrorRecord]) {
+                $stderr.WriteLine($record.ToString())
+            }
+        }
+    }
+    catch {
+        $stderr.WriteLine("[-] " + $_.Exception.Message)
+        $exitCode = 4
+    }
+    finally {
+        Pop-Location
+        [Console]::SetError($origStderr)
+    }
+
+    $response = @{ "ExitCode" = $exitCode; "Stderr" = $stderr.ToString() }
+    [Console]::Out.WriteLine("<BOXPS_DONE>" + ($response | ConvertTo-Json -Compress))
+    [Console]::Out.Flush()
+}
+"""
+
+_POOL_DONE_MARKER = "<BOXPS_DONE>"
+
+####################################################################################################
+class _PoolWorker:
+    """
+    A long-lived pwsh process running the pool worker loop.
+    """
+
+    ################################################################################################
+    def __init__(self, install_dir):
+
+        self.tasks_done = 0
+        # soft memory limits are lifted in the worker only, workers are started from many threads
+        self._proc = subprocess.Popen(["pwsh", "-noni", "-Command", _POOL_WORKER_LOOP],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL, universal_newlines=True,
+                                      preexec_fn=_unset_vmem_limit_in_child)
+        self._boxps_script = install_dir + os.sep + "box-ps.ps1"
+
+    ################################################################################################
+    def alive(self):
+        return self._proc.poll() is None
+
+    ################################################################################################
+    @property
+    def pid(self):
+        return self._proc.pid
+
+    ################################################################################################
+    def run(self, boxps_params):
+        """
+        Hands a box-ps run to the worker and waits for it to finish.
+
+        @param boxps_params (dict) parameters to box-ps.ps1 by name
+
+        @return (tuple) the exit code of box-ps and what it wrote to stderr
+        """
+
+        request = {
+            "BoxPS": self._boxps_script,
+            "Cwd": os.getcwd(),
+            "Params": boxps_params
+        }
+
+        try:
+            self._proc.stdin.write(json.dumps(request) + "\n")
+            self._proc.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise errors.BoxPSSandboxError("failed to hand script to sandbox worker: " + str(e))
+
+        # skip anything else the session happens to print until we get our answer
+        for line in self._proc.stdout:
+            if line.startswith(_POOL_DONE_MARKER):
+                break
+        else:
+            raise errors.BoxPSSandboxError("sandbox worker exited unexpectedly")
+
+        try:
+            response = json.loads(line[len(_POOL_DONE_MARKER):])
+        except ValueError as e:
+            raise errors.BoxPSSandboxError("bad response from sandbox worker: " + str(e))
+
+        self.tasks_done += 1
+        return response["ExitCode"], response["Stderr"]
+
+    ################################################################################################
+    def stop(self, wait=5):
+        """
+        Closes the worker's stdin so its loop ends, killing it if it doesn't exit in time.
+
+        @param wait (int) seconds to wait for the worker to exit on its own
+        """
+
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+
+        try:
+            self._proc.wait(timeout=wait)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+
+####################################################################################################
+class BoxPSPool(BoxPS):
+
+    ################################################################################################
+    def __init__(self, boxps_path=None, pool_size=4, max_tasks_per_worker=50, scheduler=None,
+                 cache=None):
+        """
+        Creates a BoxPS sandboxing object backed by a pool of long-lived pwsh worker processes, so
+        the PowerShell startup cost of box-ps.ps1 is paid once per worker rather than once per
+        sandboxed script. Workers are started right away so they warm up before the first script
+        arrives. A worker is replaced with a fresh one after it has sandboxed max_tasks_per_worker
+        scripts or if it crashes. sandbox() may be called from multiple threads at once, and blocks
+        until a worker is free. Docker is not supported.
+
+        @param boxps_path (str) optional path to box-ps installation
+        @param pool_size (int) number of pwsh workers to keep running
+        @param max_tasks_per_worker (int) number of scripts a worker sandboxes before it's recycled
+        @param scheduler (MemoryScheduler) optional scheduler every sandboxing run must be admitted
+        by before it's handed to a worker
+        @param cache (ReportCache) optional cache of results to return instead of sandboxing the
+        same script again
+        """
+
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+
+        if max_tasks_per_worker < 1:
+            raise ValueError("max_tasks_per_worker must be at least 1")
+
+        BoxPS.__init__(self, boxps_path=boxps_path, docker=False, scheduler=scheduler, cache=cache)
+
+        self._pool_size = pool_size
+        self._max_tasks_per_worker = max_tasks_per_worker
+        self._idle_workers = queue.Queue()
+        self._closed = False
+
+        for i in range(pool_size):
+            self._idle_workers.put(self._start_worker())
+
+    ################################################################################################
+    def _start_worker(self):
+
+        try:
+            return _PoolWorker(self._install_dir)
+        except OSError as e:
+            raise errors.BoxPSDependencyError("pwsh: " + str(e))
+
+    ################################################################################################
+    def _execute_run(self, run):
+        """
+        Hands a prepared run to the next free worker, recycling the worker afterwards if it has
+        crashed or done its share of runs.
+
+        @param run (_SandboxRun) prepared run
+
+        @return (tuple) the return code and stderr of box-ps
+        """
+
+        if self._closed:
+            raise errors.BoxPSError("sandbox pool is closed")
+
+        worker = self._idle_workers.get()
+
+        try:
+
+            # worker may have died while it was sitting idle
+            if not worker.alive():
+                worker.stop()
+                worker = self._start_worker()
+
+            admission = self._scheduler.acquire() if self._scheduler else None
+
+            # the worker's memory use is its whole process tree, including the harnessed script
+            try:
+                if admission:
+                    admission.watch(worker.pid)
+                return worker.run(run.boxps_params)
+            finally:
+                if admission:
+                    self._scheduler.release(admission)
+
+        finally:
+
+            if not worker.alive() or worker.tasks_done >= self._max_tasks_per_worker:
+                worker.stop()
+
+                # if a replacement can't be started, the dead worker goes back in the pool and
+                # starting one is tried again the next time it's handed out
+                try:
+                    worker = self._start_worker()
+                except errors.BoxPSError:
+                    pass
+
+            self._idle_workers.put(worker)
+
+    ################################################################################################
+    async def _execute_run_async(self, run):
+        """
+        Asyncio version of _execute_run. Waits for a worker on a thread of the event loop's default
+        executor, so at most pool_size of the runs will be making progress at once.
+
+        @param run (_SandboxRun) prepared run
+
+        @return (tuple) the return code and stderr of box-ps
+        """
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._execute_run, run)
+
+    ################################################################################################
+    def close(self):
+        """
+        Stops all the workers in the pool, waiting for any in-flight runs to finish first.
+        """
+
+        if self._closed:
+            return
+
+        self._closed = True
+
+        workers = []
+        while len(workers) < self._pool_size:
+            workers.append(self._idle_workers.get())
+
+        for worker in workers:
+            worker.stop()
+
+    ################################################################################################
+    def __enter__(self):
+        return self
+
+    ################################################################################################
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 ####################################################################################################
 # CLI
+####################################################################################################
+def _batch_samples(batch_path):
+    """
+    Lists the scripts to sandbox in batch mode. A directory is walked for every file in it, and any
+    other file is read as a manifest with one script path per line. Relative paths in a manifest
+    are relative to the manifest's directory, and blank lines and lines starting with # are skipped.
+
+    @param batch_path (str) path to a directory of scripts or to a manifest
+
+    @return (list) of script paths
+    """
+
+    if os.path.isdir(batch_path):
+
+        samples = []
+        for root, dirs, files in os.walk(batch_path):
+            dirs.sort()
+            samples += [os.path.join(root, name) for name in sorted(files)]
+
+        return samples
+
+    manifest_dir = os.path.dirname(os.path.abspath(batch_path))
+    with open(batch_path, "r") as f:
+        lines = [line.strip() for line in f]
+
+    return [os.path.join(manifest_dir, line) for line in lines if line and not line.startswith("#")]
+
+####################################################################################################
+def _batch_result(sample, report=None, error=None, layers=False):
+    """
+    Summarizes the sandboxing of one script in batch mode.
+
+    @param sample (str) path to the script
+    @param report (BoxPSReport) report if the script was sandboxed
+    @param error (Exception) error if it wasn't
+    @param layers (bool) include the deobfuscated layers
+
+    @return (dict) result to write as a line of JSON
+    """
+
+    result = {"file": sample}
+
+    try:
+        with open(sample, "rb") as f:
+            result["sha256"] = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        result["sha256"] = None
+
+    if error is not None:
+
+        if isinstance(error, errors.BoxPSTimeoutError):
+            result["status"] = "timeout"
+        elif isinstance(error, errors.BoxPSScriptSyntaxError):
+            result["status"] = "syntax_error"
+        else:
+            result["status"] = "error"
+
+        result["error"] = str(error).strip()
+        return result
+
+    result["status"] = "ok"
+    result["actions"] = len(report.actions)
+    result["behaviors"] = {behavior: len(actions) for behavior, actions in
+                           report.actions_by_behavior().items()}
+    result["confident_net_iocs"] = report.confident_net_iocs
+    result["confident_fs_iocs"] = report.confident_fs_iocs
+    result["aggressive_net_iocs"] = report.aggressive_net_iocs
+    result["aggressive_fs_iocs"] = report.aggressive_fs_iocs
+    result["artifact_hashes"] = report.artifact_hashes
+    result["aggressive_artifacts"] = report.aggressive_artifacts
+
+    if layers:
+        result["layers"] = report.layers
+
+    return result
+
+####################################################################################################
+async def _sandbox_batch(boxps, samples, jobs, out_file, env_vars=None, timeout=None, layers=False):
+    """
+    Sandboxes scripts concurrently, writing one line of JSON per script to out_file as each one
+    finishes. A script failing to sandbox is written out as a failure and doesn't stop the batch.
+
+    @param boxps (BoxPS) sandbox to run every script through
+    @param samples (list) of script paths
+    @param jobs (int) max number of scripts to sandbox at once
+    @param out_file (file) open file to write the JSON lines to
+    @param env_vars (dict) environment variables for every script
+    @param timeout (int) timeout for each script in seconds
+    @param layers (bool) include the deobfuscated layers in the results
+
+    @return (int) number of scripts that failed to sandbox
+    """
+
+    # reports only live as long as it takes to summarize them
+    report_dir = tempfile.mkdtemp(suffix="-boxps")
+
+    async def sandbox_sample(ndx, sample):
+
+        report_file = report_dir + os.sep + str(ndx) + ".json"
+
+        try:
+            report = await boxps.sandbox_async(in_file=sample, env_vars=env_vars, timeout=timeout,
+                                               report_only=True, report_file=report_file)
+        except Exception as e:
+            return _batch_result(sample, error=e)
+
+        try:
+            return _batch_result(sample, report=report, layers=layers)
+        finally:
+            os.remove(report_file)
+
+    samples = iter(enumerate(samples))
+    pending = set()
+    failures = 0
+
+    # start sandboxing the next script if there is one
+    def start_next():
+
+        for ndx, sample in samples:
+            pending.add(asyncio.ensure_future(sandbox_sample(ndx, sample)))
+            return True
+
+        return False
+
+    try:
+
+        while len(pending) < jobs and start_next():
+            pass
+
+        while pending:
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            while len(pending) < jobs and start_next():
+                pass
+
+            for task in done:
+
+                result = task.result()
+                if result["status"] != "ok":
+                    failures += 1
+
+                out_file.write(json.dumps(result, separators=(",", ":")) + "\n")
+                out_file.flush()
+
+    finally:
+
+        for task in pending:
+            task.cancel()
+
+        if pending:
+            await asyncio.wait(pending)
+
+        shutil.rmtree(report_dir, ignore_errors=True)
+
+    return failures
+
 ####################################################################################################
 def main_cli():
 
@@ -472,6 +1199,11 @@ directory called "analysis"...
 
 python ./boxps.py --file ./example-script.ps1 --layers --parameter-values --out-dir ./analysis
  
+
+to sandbox every script in a directory, 8 at a time, and write a line of JSON per script...
+
+python ./boxps.py --batch ./samples --jobs 8 --jsonl ./results.jsonl
+ 
 """
 
     parser= argparse.ArgumentParser(description=description, epilog=usages, 
@@ -519,12 +1251,35 @@ python ./boxps.py --file ./example-script.ps1 --layers --parameter-values --out-
         help="print everything we can unsnipped.")
     parser.add_argument("-f", "--file", required=False, action="store", help="path to powershell " +
         "script file to sandbox.")
+    parser.add_argument("-b", "--batch", required=False, action="store", help="path to a " +
+        "directory of powershell scripts, or to a manifest file listing one script path per line, " +
+        "to sandbox in parallel. A line of JSON summarizing each script's results is written as " +
+        "it finishes.")
+    parser.add_argument("-j", "--jobs", required=False, type=int, default=os.cpu_count() or 1,
+        help="max number of scripts to sandbox at once in batch mode. Fewer are run when memory " +
+        "is short. Defaults to the number of CPUs.")
+    parser.add_argument("-jl", "--jsonl", required=False, action="store", help="path to write the " +
+        "batch mode JSON lines to. Defaults to stdout.")
     args = parser.parse_args()
 
     # further arg validation
+
+    # batch mode only writes JSON lines
+    if args.batch and (args.piped or args.file or args.out_dir or args.boxed_dir or 
+                       args.report_file):
+        print("[-] can't give a script or output paths other than --jsonl with --batch")
+        exit(-1)
+
+    if args.jsonl and not args.batch:
+        print("[-] --jsonl is only used with --batch")
+        exit(-1)
+
+    if args.jobs < 1:
+        print("[-] --jobs must be at least 1")
+        exit(-1)
     
     # must give either a script or an input file
-    if not args.piped and args.file is None:
+    if not args.batch and not args.piped and args.file is None:
         print("[-] must give either piped script contents or an input file path")
         exit(-1)
 
@@ -564,6 +1319,25 @@ python ./boxps.py --file ./example-script.ps1 --layers --parameter-values --out-
         with open(args.env_file, "r") as f:
             env_vars = json.loads(f.read())
 
+    # one BoxPS for the whole batch, so the environment is only validated once
+    if args.batch:
+
+        samples = _batch_samples(args.batch)
+        scheduler = boxps_scheduler.MemoryScheduler(max_concurrency=args.jobs)
+        boxps = BoxPS(boxps_path=args.install_path, docker=args.docker, scheduler=scheduler)
+
+        out_file = open(args.jsonl, "w") if args.jsonl else sys.stdout
+
+        try:
+            failures = asyncio.run(_sandbox_batch(boxps, samples, args.jobs, out_file, env_vars,
+                                                  args.timeout, args.layers))
+        finally:
+            if args.jsonl:
+                out_file.close()
+
+        sys.stderr.write("[+] sandboxed %d script(s), %d failed\n" % (len(samples), failures))
+        return
+
     boxps = BoxPS(boxps_path=args.install_path, docker=args.docker)
 
     # powershell script is piped in
@@ -1,4 +1,5 @@
 import json
+import hashlib
 import pyboxps.errors as errors
 from enum import Enum
 
@@ -65,17 +66,65 @@ class SubBehaviors(Enum):
     new_task = 22
     map_drive = 23
     
+####################################################################################################
+def behaviors_mask(behaviors):
+    """
+    Packs Behaviors or SubBehaviors enum values into an integer bitmask.
+
+    @param behaviors (list) of Behaviors or SubBehaviors enum values
+
+    @return (int) bitmask with the bit for each value's enum value set
+    """
+
+    mask = 0
+    for behavior in behaviors:
+        mask |= 1 << behavior.value
+
+    return mask
+
+_BEHAVIOR_BITS = {behavior.name: 1 << behavior.value for behavior in Behaviors}
+_SUB_BEHAVIOR_BITS = {behavior.name: 1 << behavior.value for behavior in SubBehaviors}
+
+# bitmask -> enum values it holds. There are only ever a handful of distinct combinations
+_behaviors_from_mask = {}
+_sub_behaviors_from_mask = {}
+
+####################################################################################################
+def _unpack_mask(mask, enum, memo):
+
+    members = memo.get(mask)
+    if members is None:
+        members = tuple([member for member in enum if mask & (1 << member.value)])
+        memo[mask] = members
+
+    return members
+
 ####################################################################################################
 class Action:
 
+    # behaviors are kept as bitmasks and the object has no __dict__, which matters for reports with
+    # hundreds of thousands of actions
+    __slots__ = ["behavior_mask", "sub_behavior_mask", "actor", "line", "id", "behavior_id",
+                 "extra_info", "behavior_properties", "parameters"]
+
+    # behavior properties with flexible types from the config, and the config list they were taken
+    # from. They're the same for every action, so they're kept on the class instead of in each one
+    _flex_type_properties = frozenset()
+    _flex_type_properties_source = None
+
     ################################################################################################
     def __init__(self, boxps_config, action_dict):
 
         try:
 
-            # build a list of enum objects for behaviors and subbehaviors
-            self.behaviors = [Behaviors[behavior] for behavior in action_dict["Behaviors"]]
-            self.sub_behaviors = [SubBehaviors[behavior] for behavior in action_dict["SubBehaviors"]]
+            # pack the behaviors and subbehaviors into bitmasks
+            self.behavior_mask = 0
+            for behavior in action_dict["Behaviors"]:
+                self.behavior_mask |= _BEHAVIOR_BITS[behavior]
+
+            self.sub_behavior_mask = 0
+            for behavior in action_dict["SubBehaviors"]:
+                self.sub_behavior_mask |= _SUB_BEHAVIOR_BITS[behavior]
 
             self.actor = action_dict["Actor"]
             self.line = action_dict["Line"]
@@ -86,25 +135,20 @@ class Action:
         except KeyError as e:
             raise errors.BoxPSReportError("field in action data not present: " + str(e))
 
-        # save the behavior properties in a dict when users want to discover them
-        self.behavior_properties = {}
-
         try:
-            self.flex_type_properties = boxps_config["BehaviorPropFlexibleTypes"]
+            flex_type_properties = boxps_config["BehaviorPropFlexibleTypes"]
         except KeyError as e:
             raise errors.BoxPSReportError("field not present in config: " + str(e))
 
-        try:
+        if flex_type_properties is not Action._flex_type_properties_source:
+            Action._flex_type_properties = frozenset(flex_type_properties)
+            Action._flex_type_properties_source = flex_type_properties
 
-            # add the behavior properties as members too for when users know what behavior properties
-            # they're looking for
-            for behavior_property in action_dict["BehaviorProps"].keys():
-                property_value = action_dict["BehaviorProps"][behavior_property]
-                self.behavior_properties[behavior_property] = property_value
+        try:
 
-                # don't save flexible types as members. extra work is required to work with these
-                if behavior_property not in self.flex_type_properties:
-                    setattr(self, behavior_property, property_value)
+            # save the behavior properties in a dict when users want to discover them. They're
+            # also available as members (see __getattr__) when users know what they're looking for
+            self.behavior_properties = action_dict["BehaviorProps"]
                     
             # just save a dict of the parameters used
             self.parameters = action_dict["Parameters"]
@@ -112,6 +156,55 @@ class Action:
         except KeyError as e:
             raise errors.BoxPSReportError("field in action data not present: " + str(e))
 
+    ################################################################################################
+    def __getattr__(self, name):
+        """
+        Behavior properties are accessible as members, except for flexible types. Extra work is
+        required to work with those.
+        """
+
+        try:
+            behavior_properties = object.__getattribute__(self, "behavior_properties")
+        except AttributeError:
+            raise AttributeError(name)
+
+        if name in behavior_properties and name not in self.flex_type_properties:
+            return behavior_properties[name]
+
+        raise AttributeError(name)
+
+    ################################################################################################
+    @property
+    def flex_type_properties(self):
+        """
+        @return (frozenset) names of the behavior properties with flexible types
+        """
+        return Action._flex_type_properties
+
+    ################################################################################################
+    @property
+    def behaviors(self):
+        """
+        @return (list) of Behaviors enum values, in enum order
+        """
+        return list(_unpack_mask(self.behavior_mask, Behaviors, _behaviors_from_mask))
+
+    ################################################################################################
+    @property
+    def sub_behaviors(self):
+        """
+        @return (list) of SubBehaviors enum values, in enum order
+        """
+        return list(_unpack_mask(self.sub_behavior_mask, SubBehaviors, _sub_behaviors_from_mask))
+
+    ################################################################################################
+    def has_behavior(self, behavior):
+        return bool(self.behavior_mask & (1 << behavior.value))
+
+    ################################################################################################
+    def has_sub_behavior(self, sub_behavior):
+        return bool(self.sub_behavior_mask & (1 << sub_behavior.value))
+
     ################################################################################################
     def __repr__(self):
         r = "--- ACTION ---"
@@ -137,7 +230,21 @@ class Action:
 class BoxPSReport:
 
     ################################################################################################
-    def __init__(self, boxps_config, report_dict=None, report_path=None):
+    def __init__(self, boxps_config, report_dict=None, report_path=None, lazy=False):
+        """
+        Deserializes a box-ps JSON report, either from a dict or straight from the file.
+
+        In lazy mode, Action objects and the indexes over them aren't built until the actions are
+        first used (the actions member, get_action, filter_actions, etc.), so callers that only want
+        the IOCs and artifacts don't pay for them. Bad action data is then reported on that first
+        use rather than here. The whole JSON report is still parsed and held in memory either way;
+        use BoxPSReportReader to go through a large report in bounded memory.
+
+        @param boxps_config (dict) box-ps config
+        @param report_dict (dict) report already read from JSON
+        @param report_path (str) path to the JSON report file
+        @param lazy (bool) wait to build the actions until they're used
+        """
 
         if report_dict is not None and report_path is not None:
             raise ValueError("can't give both a report dict and report file path")
@@ -155,39 +262,60 @@ class BoxPSReport:
             except Exception as e:
                 raise errors.BoxPSReportError("failed to read box-ps report file: " + str(e))
 
-        # deserialize actions into a list sorted by order of execution (action ID)
-        self.actions = []
-
         try:
             actions_pool = report_dict["Actions"]
         except KeyError:
             raise errors.BoxPSReportError("no Actions field in report")
 
-        # basically selection sort the actions list
-        while len(actions_pool) != 0:
+        try:
+            flex_type_properties = boxps_config["BehaviorPropFlexibleTypes"]
+        except KeyError as e:
+            raise errors.BoxPSReportError("field not present in config: " + str(e))
 
-            curr_act_dict = actions_pool.pop(0)
-            action = Action(boxps_config, curr_act_dict)
-            action_ndx = 0
+        # put the raw actions in order of execution (action ID). Actions sharing an ID end up
+        # latest first, same as the insertion sort this replaced
+        try:
+            order = sorted(range(len(actions_pool)),
+                           key=lambda ndx: (actions_pool[ndx]["Id"], -ndx))
+        except KeyError as e:
+            raise errors.BoxPSReportError("field in action data not present: " + str(e))
 
-            while (action_ndx < len(self.actions)) and (action.id > self.actions[action_ndx].id):
-                action_ndx += 1
+        self._boxps_config = boxps_config
+        self._action_dicts = [actions_pool[ndx] for ndx in order]
+        self._actions = None
+        self._layers = None
 
-            self.actions.insert(action_ndx, action)
+        if not lazy:
+            self._load_actions()
 
-        # confident network and file_system IOCs from action behavior properties
-        network_actions = self.filter_actions(behaviors=[Behaviors.network])
-        file_system_actions = self.filter_actions(behaviors=[Behaviors.file_system])
+        # confident network and file_system IOCs from action behavior properties. Taken from the
+        # raw actions so lazy reports don't have to build them
         self.confident_net_iocs = []
-        for network_action in network_actions:
-            if (hasattr(network_action, "uri")):
-                self.confident_net_iocs.append(network_action.uri)
-            if (hasattr(network_action, "hostname")):
-                self.confident_net_iocs.append("http://" + network_action.hostname)
         self.confident_fs_iocs = []
-        for fs_action in file_system_actions:
-            if (hasattr(fs_action, "paths") and isinstance(fs_action.paths, list)):
-                self.confident_fs_iocs += fs_action.paths
+        for action_dict in self._action_dicts:
+
+            try:
+                behaviors = action_dict["Behaviors"]
+                behavior_props = action_dict["BehaviorProps"]
+            except KeyError as e:
+                raise errors.BoxPSReportError("field in action data not present: " + str(e))
+
+            # flexible types aren't behavior property members of an Action
+            props = {name: behavior_props[name] for name in ["uri", "hostname", "paths"]
+                     if name in behavior_props and name not in flex_type_properties}
+
+            if "network" in behaviors:
+                if "uri" in props:
+                    self.confident_net_iocs.append(props["uri"])
+                if "hostname" in props:
+                    self.confident_net_iocs.append("http://" + props["hostname"])
+
+            if "file_system" in behaviors:
+                if "paths" in props and isinstance(props["paths"], list):
+                    self.confident_fs_iocs += props["paths"]
+
+        if self._actions is not None:
+            self._action_dicts = None
 
         # aggressive IOCs
         try:
@@ -216,34 +344,100 @@ class BoxPSReport:
         except KeyError:
             raise errors.BoxPSReportError("no artifacts field in report")
 
+    ################################################################################################
+    @property
+    def actions(self):
+        """
+        @return (list) of Action objects sorted by order of execution in the script
+        """
+
+        if self._actions is None:
+            self._load_actions()
+            self._action_dicts = None
+
+        return self._actions
+
+    ################################################################################################
+    def _load_actions(self):
+        """
+        Builds the Action objects from the raw actions, already in order, and indexes them.
+        """
+
+        self._actions = [Action(self._boxps_config, action_dict)
+                         for action_dict in self._action_dicts]
+        self._index_actions()
+
+    ################################################################################################
+    def _index_actions(self):
+        """
+        Indexes the actions by ID, behavior, sub-behavior, and actor. Everything but the ID index
+        maps to lists of positions in the actions list, in order.
+        """
+
+        self._ndx_by_id = {}
+        self._ndxs_by_behavior = {}
+        self._ndxs_by_sub_behavior = {}
+        self._ndxs_by_actor = {}
+
+        for ndx, action in enumerate(self._actions):
+
+            # first action wins if an ID is somehow repeated, same as a linear search
+            self._ndx_by_id.setdefault(action.id, ndx)
+
+            for behavior in action.behaviors:
+                self._ndxs_by_behavior.setdefault(behavior, []).append(ndx)
+
+            for sub_behavior in action.sub_behaviors:
+                self._ndxs_by_sub_behavior.setdefault(sub_behavior, []).append(ndx)
+
+            self._ndxs_by_actor.setdefault(action.actor, []).append(ndx)
+
     ################################################################################################
     @property
     def layers(self):
         """
         Gathers any deobfuscated layers present in the actions. Only includes unique layers gathered
-        from actions with the "code_import" or "script_exec" behavior.
+        from actions with the "code_import" or "script_exec" behavior. Only computed once.
 
         @return (list) unique list of deobfuscated script layers
         """
 
-        layers = []
+        if self._layers is None:
+            self._layers = list(self.iter_layers())
+
+        return self._layers
+
+    ################################################################################################
+    def iter_layers(self):
+        """
+        Same as the layers member, but yields the layers one at a time, so they can be written out
+        as they come without holding all of them in memory.
+
+        @return (generator) of unique deobfuscated script layers, in order of execution
+        """
+
+        # layers are told apart by the hash of their content. Only the digests are held on to
+        seen_digests = set()
         filtered = self.filter_actions(behaviors=[Behaviors.script_exec, Behaviors.code_import])
 
         for action in filtered:
 
             layer = ""
 
-            if ((Behaviors.script_exec in action.behaviors) and
+            if ((action.has_behavior(Behaviors.script_exec)) and
                 hasattr(action, "script") and
                 (action.script != "")):
                 layer = action.script
-            elif Behaviors.code_import in action.behaviors and action.code != "":
+            elif action.has_behavior(Behaviors.code_import) and action.code != "":
                 layer = action.code
 
-            if layer and layer not in layers:
-                layers.append(layer)
+            if not layer:
+                continue
 
-        return layers
+            digest = hashlib.sha256(layer.encode("utf-8", "surrogatepass")).digest()
+            if digest not in seen_digests:
+                seen_digests.add(digest)
+                yield layer
 
     ################################################################################################
     def get_action(self, action_id):
@@ -254,7 +448,10 @@ class BoxPSReport:
         
         @return (Action)
         """
-        return get_action(self.actions, action_id)    
+
+        actions = self.actions
+        ndx = self._ndx_by_id.get(action_id)
+        return None if ndx is None else actions[ndx]
 
     ################################################################################################
     def filter_actions(self, behaviors=[], sub_behaviors=[], actors=[], parameters=[]):
@@ -270,12 +467,33 @@ class BoxPSReport:
 
         @return (list) filtered actions
         """
-        return filter_actions(self.actions, behaviors, sub_behaviors, actors, parameters)
+
+        actions = self.actions
+        ndxs = set()
+
+        for behavior in behaviors:
+            ndxs.update(self._ndxs_by_behavior.get(behavior, []))
+
+        for sub_behavior in sub_behaviors:
+            ndxs.update(self._ndxs_by_sub_behavior.get(sub_behavior, []))
+
+        # there are far fewer distinct actors than actions
+        for actor in self._ndxs_by_actor:
+            if [a for a in actors if a in actor]:
+                ndxs.update(self._ndxs_by_actor[actor])
+
+        # parameters aren't indexed, only look at the actions that haven't matched yet
+        if parameters:
+            for ndx, action in enumerate(actions):
+                if ndx not in ndxs and [p for p in parameters if p in action.parameters.keys()]:
+                    ndxs.add(ndx)
+
+        return [actions[ndx] for ndx in sorted(ndxs)]
 
     ################################################################################################
     def __repr__(self):
         return self.gloss
-    
+
     ################################################################################################
     def actions_by_behavior(self):
         """
@@ -284,7 +502,11 @@ class BoxPSReport:
 
         @return (dict) where the keys are behaviors and the values are lists of actions
         """
-        return actions_by_behavior(self.actions)
+
+        # the index holds behaviors in the order they're first seen, like walking the actions would
+        actions = self.actions
+        return {behavior.name: [actions[ndx] for ndx in ndxs]
+                for behavior, ndxs in self._ndxs_by_behavior.items()}
 
 
 ################################################################################################
@@ -321,18 +543,18 @@ def filter_actions(actions, behaviors=[], sub_behaviors=[], actors=[], parameter
     """
 
     filtered = []
-    behavior_filter = set(behaviors)
-    sub_behavior_filter = set(sub_behaviors)
+    behavior_filter = behaviors_mask(behaviors)
+    sub_behavior_filter = behaviors_mask(sub_behaviors)
 
     for action in actions:
 
         # check for a desired behavior
-        if set(action.behaviors) & behavior_filter:
+        if action.behavior_mask & behavior_filter:
             filtered.append(action)
             continue
 
         # check for a desired sub_behavior
-        if set(action.sub_behaviors) & sub_behavior_filter:
+        if action.sub_behavior_mask & sub_behavior_filter:
             filtered.append(action)
             continue
 
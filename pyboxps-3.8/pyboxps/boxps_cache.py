@@ -0,0 +1,281 @@
+import os
+import time
+import json
+import shutil
+import hashlib
+import fcntl
+import tempfile
+import contextlib
+
+# files in the box-ps install directory, outside of harness/, that decide how a script is sandboxed
+_INSTALL_FILES = [
+    "config.json",
+    "box-ps.ps1",
+    "HarnessBuilder.psm1",
+    "ScriptInspector.psm1",
+    "Utils.psm1",
+    "iocs_ignore_vars.txt",
+    "pretend_paths.txt"
+]
+
+####################################################################################################
+class ReportCache:
+
+    ################################################################################################
+    def __init__(self, cache_dir, max_size_mb=1024, ttl=7 * 24 * 60 * 60):
+        """
+        Content-addressed on-disk cache of box-ps results. Entries are keyed on the SHA256 of the
+        script content, the box-ps config and harness files, and the environment variables given
+        to the sandbox, and hold the JSON report along with the full analysis directory when the
+        run produced one. Least recently used entries are evicted once the cache grows past
+        max_size_mb, and entries older than ttl seconds are never returned. Any number of processes
+        may share one cache directory.
+
+        @param cache_dir (str) directory to keep the cache in. Created if it doesn't exist
+        @param max_size_mb (int) size the cache is trimmed down to after each new entry
+        @param ttl (int) seconds an entry is good for after it's stored
+        """
+
+        self._cache_dir = cache_dir
+        self._entries_dir = cache_dir + os.sep + "entries"
+        self._tmp_dir = cache_dir + os.sep + "tmp"
+        self._lock_path = cache_dir + os.sep + "lock"
+        self._max_size = max_size_mb * 1024 * 1024
+        self._ttl = ttl
+
+        # install directory -> (stat signature of its files, digest of their content)
+        self._install_digests = {}
+
+        os.makedirs(self._entries_dir, exist_ok=True)
+        os.makedirs(self._tmp_dir, exist_ok=True)
+
+    ################################################################################################
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        """
+        Holds the cache-wide lock. Readers share it, anything changing the entries takes it
+        exclusively.
+        """
+
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    ################################################################################################
+    def _install_paths(self, install_dir):
+
+        paths = [install_dir + os.sep + name for name in _INSTALL_FILES]
+
+        harness_dir = install_dir + os.sep + "harness"
+        if os.path.isdir(harness_dir):
+            paths += [harness_dir + os.sep + name for name in sorted(os.listdir(harness_dir))]
+
+        return [path for path in paths if os.path.isfile(path)]
+
+    ################################################################################################
+    def _install_digest(self, install_dir):
+        """
+        Hashes the config and harness files of a box-ps installation. Only rehashed when one of the
+        files changes on disk.
+
+        @param install_dir (str) path to the box-ps installation
+
+        @return (str) hex digest
+        """
+
+        paths = self._install_paths(install_dir)
+        signature = []
+        for path in paths:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+
+        cached = self._install_digests.get(install_dir)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        sha256 = hashlib.sha256()
+        for path in paths:
+            sha256.update(os.path.relpath(path, install_dir).encode() + b"\0")
+            with open(path, "rb") as f:
+                sha256.update(hashlib.sha256(f.read()).digest())
+
+        digest = sha256.hexdigest()
+        self._install_digests[install_dir] = (signature, digest)
+
+        return digest
+
+    ################################################################################################
+    def key(self, install_dir, script, env_vars=None, docker=False):
+        """
+        Computes the cache key for sandboxing a script.
+
+        @param install_dir (str) path to the box-ps installation
+        @param script (bytes) script content
+        @param env_vars (dict) environment variables given to the sandbox
+        @param docker (bool) whether the script is sandboxed in docker
+
+        @return (str) hex digest
+        """
+
+        sha256 = hashlib.sha256()
+        sha256.update(hashlib.sha256(script).digest())
+        sha256.update(self._install_digest(install_dir).encode())
+        sha256.update(json.dumps(env_vars, sort_keys=True).encode())
+        sha256.update(b"docker" if docker else b"local")
+
+        return sha256.hexdigest()
+
+    ################################################################################################
+    def _read_meta(self, entry_dir):
+
+        try:
+            with open(entry_dir + os.sep + "meta.json", "r") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    ################################################################################################
+    def _expired(self, meta):
+        return meta is None or time.time() - meta["created"] > self._ttl
+
+    ################################################################################################
+    def fetch(self, key, report_path=None, out_dir=None):
+        """
+        Copies a cached result out of the cache. Only counts as a hit if the entry has everything
+        asked for, so asking for an analysis directory misses on entries from report-only runs.
+
+        @param key (str) cache key
+        @param report_path (str) path to copy the JSON report to
+        @param out_dir (str) directory to copy the analysis directory into
+
+        @return (bool) whether it was a hit
+        """
+
+        entry_dir = self._entries_dir + os.sep + key
+
+        with self._locked(exclusive=False):
+
+            meta = self._read_meta(entry_dir)
+            if self._expired(meta) or (out_dir is not None and not meta["has_dir"]):
+                return False
+
+            try:
+
+                if report_path is not None:
+                    shutil.copyfile(entry_dir + os.sep + "report.json", report_path)
+
+                if out_dir is not None:
+                    shutil.copytree(entry_dir + os.sep + "out_dir", out_dir, dirs_exist_ok=True)
+
+                # last use time drives eviction
+                os.utime(entry_dir)
+
+            except OSError:
+                return False
+
+        return True
+
+    ################################################################################################
+    def store(self, key, report_path, out_dir=None):
+        """
+        Adds the result of a sandboxing run to the cache, then evicts entries until the cache fits
+        in its size limit. An unexpired entry that already holds as much is left alone.
+
+        @param key (str) cache key
+        @param report_path (str) path to the JSON report
+        @param out_dir (str) path to the full analysis directory if the run produced one
+        """
+
+        # build the entry off to the side, so it only shows up once it's complete
+        new_dir = tempfile.mkdtemp(dir=self._tmp_dir)
+
+        try:
+
+            shutil.copyfile(report_path, new_dir + os.sep + "report.json")
+            if out_dir is not None:
+                shutil.copytree(out_dir, new_dir + os.sep + "out_dir")
+
+            meta = {
+                "created": time.time(),
+                "has_dir": out_dir is not None,
+                "size": _dir_size(new_dir)
+            }
+            with open(new_dir + os.sep + "meta.json", "w") as f:
+                f.write(json.dumps(meta))
+
+            entry_dir = self._entries_dir + os.sep + key
+
+            with self._locked(exclusive=True):
+
+                old_meta = self._read_meta(entry_dir)
+                if os.path.exists(entry_dir):
+
+                    if not self._expired(old_meta) and (old_meta["has_dir"] or out_dir is None):
+                        return
+
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+
+                os.rename(new_dir, entry_dir)
+                self._evict()
+
+        finally:
+            shutil.rmtree(new_dir, ignore_errors=True)
+
+    ################################################################################################
+    def _evict(self):
+        """
+        Removes expired entries, then least recently used ones until the cache fits in its size
+        limit. Must hold the lock exclusively.
+        """
+
+        entries = []
+        total_size = 0
+
+        for key in os.listdir(self._entries_dir):
+
+            entry_dir = self._entries_dir + os.sep + key
+            meta = self._read_meta(entry_dir)
+
+            if self._expired(meta):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+
+            try:
+                last_used = os.stat(entry_dir).st_mtime
+            except OSError:
+                continue
+
+            entries.append((last_used, meta["size"], entry_dir))
+            total_size += meta["size"]
+
+        entries.sort()
+        for last_used, size, entry_dir in entries:
+
+            if total_size <= self._max_size:
+                break
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+
+    ################################################################################################
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+
+        with self._locked(exclusive=True):
+            for key in os.listdir(self._entries_dir):
+                shutil.rmtree(self._entries_dir + os.sep + key, ignore_errors=True)
+
+####################################################################################################
+def _dir_size(path):
+
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+
+    return size
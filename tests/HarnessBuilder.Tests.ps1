@@ -0,0 +1,34 @@
+# tests of the harness building helpers in HarnessBuilder.psm1. Run with Pester 5 from the repo root
+#   Invoke-Pester ./tests
+
+BeforeAll {
+    Import-Module -Name "$PSScriptRoot/../HarnessBuilder.psm1" -Force
+}
+
+Describe "BehaviorId" {
+
+    It "identifies bytes the same whether they're in a byte array or an object array" {
+        $bytes = [byte[]]@(77, 90, 0, 1)
+        BehaviorId "actor" @{ "content" = [object[]]@($bytes) } | Should -Be (BehaviorId "actor" @{ "content" = $bytes })
+    }
+
+    It "tells apart arrays of other values" {
+        BehaviorId "actor" @{ "content" = [object[]]@(77, 90) } | Should -Not -Be (BehaviorId "actor" @{ "content" = [byte[]]@(77, 90) })
+        BehaviorId "actor" @{ "content" = @("a", "b") } | Should -Not -Be (BehaviorId "actor" @{ "content" = @("ab") })
+    }
+}
+
+Describe "ConvertToByteArray" {
+
+    It "converts object arrays holding only bytes" {
+        $converted = ConvertToByteArray ([object[]]@([byte]1, [byte]2))
+        $converted.GetType() | Should -Be ([byte[]])
+        $converted | Should -Be @(1, 2)
+    }
+
+    It "leaves anything else alone" {
+        ConvertToByteArray ([object[]]@([byte]1, 2)) | Should -BeNullOrEmpty
+        ConvertToByteArray ([byte[]]@(1, 2)) | Should -BeNullOrEmpty
+        ConvertToByteArray @() | Should -BeNullOrEmpty
+    }
+}
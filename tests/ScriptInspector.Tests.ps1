@@ -0,0 +1,24 @@
+# tests of the scraping done by ScriptInspector.psm1. Run with Pester 5 from the repo root
+#   Invoke-Pester ./tests
+
+BeforeAll {
+    Import-Module -Name "$PSScriptRoot/../ScriptInspector.psm1" -Force
+}
+
+Describe "ScrapeEnvironmentProbes" {
+
+    It "finds the language in a variable" {
+        ScrapeEnvironmentProbes -Variable "en-US" | Should -Be "language,English (United States),NULL"
+        ScrapeEnvironmentProbes -Variable "German (Germany)" | Should -Be "language,German (Germany),NULL"
+    }
+
+    It "finds no language in a variable holding plain text" {
+        foreach ($text in @("language", "mega", "the yield of the vault", "Fontaine", "Idomeneo", "pagan")) {
+            ScrapeEnvironmentProbes -Variable $text | Should -BeNullOrEmpty -Because "'$text' names no language"
+        }
+    }
+
+    It "finds languages the script compares against" {
+        ScrapeEnvironmentProbes "if (`$lang -ne 'en-US') { exit }" | Should -Be "language,English (United States),ne"
+    }
+}
@@ -0,0 +1,48 @@
+# tests of the code rewrites in Utils.psm1. Run with Pester 5 from the repo root
+#   Invoke-Pester ./tests
+
+BeforeAll {
+
+    $utils = Import-Module -Name "$PSScriptRoot/../Utils.psm1" -AsCustomObject -Scope Local
+
+    # how strings used to be folded, a pair at a time until nothing changes
+    function FoldPairwise {
+
+        param(
+            [string] $Code
+        )
+
+        $r = $Code
+        $old_r = ""
+        while ($old_r -ne $r) {
+            $old_r = $r
+            $r = $r -replace "'([^']*)' *\+ *'([^']*)'", '''$1$2'''
+        }
+
+        return $r
+    }
+}
+
+Describe "RewriteStringConcats" {
+
+    It "folds a whole chain of strings" {
+        $utils.RewriteStringConcats("`$a = 'fo'+'o' + 'ba'  +  'r'; 'b'+'az'") | Should -Be "`$a = 'foobar'; 'baz'"
+    }
+
+    It "folds like a pair at a time when quotes don't pair up" {
+        $code = "' ''+  '+ '+''  "
+        $utils.RewriteStringConcats($code) | Should -Be (FoldPairwise $code)
+    }
+
+    It "folds random code the same as a pair at a time" {
+
+        $random = [Random]::new(23)
+        $chars = "'''++  ab"
+
+        for ($i = 0; $i -lt 20000; $i++) {
+
+            $code = -join (1..$random.Next(1, 25) | ForEach-Object { $chars[$random.Next($chars.Length)] })
+            $utils.RewriteStringConcats($code) | Should -Be (FoldPairwise $code) -Because "folding '$code'"
+        }
+    }
+}
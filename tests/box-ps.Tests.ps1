@@ -0,0 +1,213 @@
+# end to end tests sandboxing small scripts with box-ps. Run with Pester 5 from the repo root
+#   Invoke-Pester ./tests
+
+BeforeAll {
+
+    $BOXPS = "$PSScriptRoot/../box-ps.ps1"
+
+    # sandboxes the script and returns the parsed report along with the exit code of box-ps
+    function SandboxScript {
+
+        param(
+            [string] $Script,
+            [string] $Timeout
+        )
+
+        $reportPath = [IO.Path]::GetTempFileName()
+
+        $boxpsArgs = @("-noni", $BOXPS, "-ScriptContent", $Script, "-ReportOnly", "-OutFile", $reportPath)
+        if ($Timeout) {
+            $boxpsArgs += @("-Timeout", $Timeout)
+        }
+
+        pwsh @boxpsArgs > $null 2>&1
+        $exitCode = $LASTEXITCODE
+
+        $report = $null
+        if ((Get-Item $reportPath).Length -gt 0) {
+            $report = Get-Content -Raw $reportPath | ConvertFrom-Json
+        }
+        Remove-Item $reportPath
+
+        return @{
+            "ExitCode" = $exitCode;
+            "Report" = $report
+        }
+    }
+
+    # Sandboxes the script keeping the working directory it leaves behind, and returns its path along
+    # with the exit code of box-ps. box-ps is started as its own process to know its PID, which names
+    # the working directory
+    function SandboxScriptKeepingWorkDir {
+
+        param(
+            [string] $Script,
+            [string[]] $BoxPSArgs
+        )
+
+        $scriptPath = "$TestDrive/script_$([Guid]::NewGuid()).ps1"
+        $Script | Out-File $scriptPath
+
+        $boxps = Start-Process pwsh -ArgumentList (@("-noni", $BOXPS, $scriptPath, "-ReportOnly", 
+            "-OutFile", "$TestDrive/report.json", "-NoCleanUp") + $BoxPSArgs) `
+            -WorkingDirectory $TestDrive -PassThru -Wait
+
+        return @{
+            "ExitCode" = $boxps.ExitCode;
+            "WorkDir" = "$TestDrive/working_$($boxps.Id)"
+        }
+    }
+}
+
+Describe "in-memory PE scanning" {
+
+    It "reports a buffer decoded into a PE in place after it was first scanned" {
+
+        $script = @'
+$buf = [byte[]]::new(30000)
+$null = New-Object System.Text.StringBuilder
+for ($i = 0; $i -lt $buf.Length; $i++) { $buf[$i] = $buf[$i] -bxor 0x41 }
+$buf[0] = 77
+$buf[1] = 90
+$null = New-Object System.Text.StringBuilder
+'@
+
+        $expected = [byte[]]::new(30000)
+        for ($i = 0; $i -lt $expected.Length; $i++) { $expected[$i] = 0x41 }
+        $expected[0] = 77
+        $expected[1] = 90
+        $sha256 = [BitConverter]::ToString([Security.Cryptography.SHA256]::HashData($expected)).Replace("-", "")
+
+        $result = SandboxScript $script
+
+        $result.ExitCode | Should -Be 0
+        $result.Report.PotentialArtifacts | Should -Contain $sha256
+    }
+
+    It "reports a PE decoded in place after it was first scanned" {
+
+        $script = @'
+$buf = [byte[]]::new(30000)
+$buf[0] = 77
+$buf[1] = 90
+$null = New-Object System.Text.StringBuilder
+for ($i = 2; $i -lt $buf.Length; $i++) { $buf[$i] = $buf[$i] -bxor 0x41 }
+$null = New-Object System.Text.StringBuilder
+'@
+
+        $encoded = [byte[]]::new(30000)
+        $encoded[0] = 77
+        $encoded[1] = 90
+        $decoded = [byte[]]$encoded.Clone()
+        for ($i = 2; $i -lt $decoded.Length; $i++) { $decoded[$i] = 0x41 }
+        $encodedSha256 = [BitConverter]::ToString([Security.Cryptography.SHA256]::HashData($encoded)).Replace("-", "")
+        $decodedSha256 = [BitConverter]::ToString([Security.Cryptography.SHA256]::HashData($decoded)).Replace("-", "")
+
+        $result = SandboxScript $script
+
+        $result.ExitCode | Should -Be 0
+        $result.Report.PotentialArtifacts | Should -Contain $encodedSha256
+        $result.Report.PotentialArtifacts | Should -Contain $decodedSha256
+    }
+
+    It "reports a PE built up byte by byte into an object array" {
+
+        $script = @'
+$buf = [byte[]]::new(30000)
+$buf[0] = 77 -bxor 0x41
+$buf[1] = 90 -bxor 0x41
+$pe = $buf | ForEach-Object { [byte]($_ -bxor 0x41) }
+$null = New-Object System.Text.StringBuilder
+'@
+
+        $expected = [byte[]]::new(30000)
+        for ($i = 0; $i -lt $expected.Length; $i++) { $expected[$i] = 0x41 }
+        $expected[0] = 77
+        $expected[1] = 90
+        $sha256 = [BitConverter]::ToString([Security.Cryptography.SHA256]::HashData($expected)).Replace("-", "")
+
+        $result = SandboxScript $script
+
+        $result.ExitCode | Should -Be 0
+        $result.Report.PotentialArtifacts | Should -Contain $sha256
+    }
+}
+
+Describe "action recording" {
+
+    It "keeps the actions of a script killed by the timeout" {
+
+        # the hang in the finally block outlasts the interrupt, so the script has to be killed
+        $script = @'
+Start-Process "notepad.exe"
+try { for (;;) {} } finally { for (;;) {} }
+'@
+
+        $result = SandboxScriptKeepingWorkDir $script @("-Timeout", "10")
+
+        $result.ExitCode | Should -Be 124
+
+        $actionsJson = Get-Content -Raw "$($result.WorkDir)/actions.json"
+        $actions = "[" + $actionsJson.TrimEnd(",`r`n") + "]" | ConvertFrom-Json
+
+        $actions.Actor | Should -Contain "Microsoft.PowerShell.Management\Start-Process"
+    }
+}
+
+Describe "nested scripts" {
+
+    It "keeps the output of a nested script run in process" {
+
+        $child = [Convert]::ToBase64String([Text.Encoding]::Unicode.GetBytes('Write-Output "from the child"'))
+        $script = "powershell -enc $child`r`nWrite-Output `"from the parent`""
+
+        $result = SandboxScriptKeepingWorkDir $script @("-InProcess")
+
+        $result.ExitCode | Should -Be 0
+
+        $stdout = Get-Content "$($result.WorkDir)/stdout.txt"
+        $stdout | Should -Contain "from the child"
+        $stdout | Should -Contain "from the parent"
+    }
+}
+
+Describe "serving requests" {
+
+    It "stops a nested script running forever at the deadline of its request" {
+
+        # the child records an action once it's stopped
+        $child = [Convert]::ToBase64String([Text.Encoding]::Unicode.GetBytes(
+            'try { for (;;) {} } finally { Start-Process "calc.exe" }'))
+        $request = @{ "Id" = 1; "Script" = "powershell -enc $child"; "Timeout" = 5 } | ConvertTo-Json -Compress
+        $request | Out-File "$TestDrive/requests.jsonl"
+
+        $boxps = Start-Process pwsh -ArgumentList @("-noni", $BOXPS, "-Serve", "-PoolSize", "1", "-NoCleanUp") `
+            -RedirectStandardInput "$TestDrive/requests.jsonl" -RedirectStandardOutput "$TestDrive/responses.jsonl" `
+            -WorkingDirectory $TestDrive -PassThru -Wait
+
+        $response = Get-Content "$TestDrive/responses.jsonl" | ConvertFrom-Json
+        $response.Id | Should -Be 1
+        $response.ExitCode | Should -Be 124
+
+        $actionsJson = Get-Content -Raw "$TestDrive/request_$($boxps.Id)-1/working_$($boxps.Id)-1/actions.json"
+        $actions = "[" + $actionsJson.TrimEnd(",`r`n") + "]" | ConvertFrom-Json
+
+        $actions.BehaviorProps.files | Should -Contain "calc.exe"
+    }
+
+    It "gives nested scripts the environment variables of their request" {
+
+        $child = [Convert]::ToBase64String([Text.Encoding]::Unicode.GetBytes('Start-Process $env:computername'))
+        $request = @{ "Id" = 1; "Script" = "powershell -enc $child"; "EnvVars" = @{ "computername" = "requestbox" } } | 
+            ConvertTo-Json -Compress
+        $request | Out-File "$TestDrive/requests.jsonl"
+
+        Start-Process pwsh -ArgumentList @("-noni", $BOXPS, "-Serve", "-PoolSize", "1") `
+            -RedirectStandardInput "$TestDrive/requests.jsonl" -RedirectStandardOutput "$TestDrive/responses.jsonl" `
+            -WorkingDirectory $TestDrive -Wait
+
+        $response = Get-Content "$TestDrive/responses.jsonl" | ConvertFrom-Json
+        $response.ExitCode | Should -Be 0
+        $response.Report.Actions.BehaviorProps.files | Should -Contain "requestbox"
+    }
+}